@@ -0,0 +1,55 @@
+"""
+micro-benchmark of Sentence: memory per sentence, ngram matching and
+stopword filtering speed
+usage: python benchmark.py [number of sentences]
+"""
+
+import random
+import sys
+import time
+
+from sentence import Sentence
+
+def sentence_size(sen):
+    """ bytes of a Sentence object, its attributes and its token list """
+    size = sys.getsizeof(sen) + sys.getsizeof(sen._sen)
+    if hasattr(sen, "__dict__"):
+        size += sys.getsizeof(sen.__dict__)
+    return size
+
+def timed(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def match_all(sentences, ngrams):
+    for sen in sentences:
+        for ngram in ngrams:
+            sen.ngram_positions(ngram)
+
+def filter_all(sentences, stopwords):
+    for sen in sentences:
+        sen.remove_toks(stopwords)
+
+def main():
+    n = (int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    rnd = random.Random(0)
+    vocab_size = 50
+    token_lists = [[rnd.randrange(vocab_size) for _ in xrange(20)]
+                   for _ in xrange(n)]
+    sentences = [Sentence(toks) for toks in token_lists]
+    ngrams = [tuple(rnd.randrange(vocab_size) for _ in xrange(l))
+              for l in (1, 2, 2, 3, 3, 4)]
+
+    size = sum(sentence_size(sen) for sen in sentences)
+    print "memory: {0:.1f} bytes/sentence".format(float(size) / n)
+
+    t = timed(match_all, sentences, ngrams)
+    print "ngram match: {0:.0f} matches/s".format(n * len(ngrams) / t)
+
+    stopwords = set(xrange(0, vocab_size, 5))
+    t = timed(filter_all, sentences, stopwords)
+    print "stopword filter: {0:.0f} sentences/s".format(n / t)
+
+if __name__ == "__main__":
+    main()
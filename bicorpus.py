@@ -1,23 +1,190 @@
 import logging
 import gc
+import os
+from array import array
 from collections import defaultdict
-from itertools import combinations
-
-from hunmisc.xstring.stringdiff import levenshtein
+from itertools import combinations, islice, izip
+from multiprocessing import Pool
+from heapq import heappush, heapreplace
 
 from corpus import Corpus
+import parallel
+from bitset import Bitset
+from topk import SpaceSaving
+from snapshot import write_snapshot, Snapshot
+from strdiff import bounded_levenshtein, DeletionIndex
+
+# phases, that can run in worker processes: reading input, unigram (set)
+# pair search and ngram extension
+PARALLEL_PHASES = ("read", "search", "ngrams")
+
+def _count_shard(shard):
+    """ counts src -> tgt cooccurences in a range of sentences """
+    start, end = shard
+    bc = parallel.shared()
+    counts = {}
+    for sen_i in xrange(start, end):
+        src, tgt = bc._src[sen_i], bc._tgt[sen_i]
+        for src_tok in src:
+            if src_tok not in counts:
+                counts[src_tok] = {}
+            row = counts[src_tok]
+            for tgt_tok in tgt:
+                row[tgt_tok] = row.get(tgt_tok, 0) + 1
+    return counts
+
+class _ReversedToken(object):
+    """ token in a heap item, that orders tokens in reverse, so the smallest
+    item of a heap is the one with the lowest count and then the largest
+    token. Tokens can be ints or strings """
+    __slots__ = ["tok"]
+
+    def __init__(self, tok):
+        self.tok = tok
+
+    def __lt__(self, other):
+        return other.tok < self.tok
+
+    def __eq__(self, other):
+        return self.tok == other.tok
+
+def _search_set_pair_shard(shard):
+    """ unigram set pair search for a range of source tokens """
+    start, end = shard
+    bc, src_toks, search_args = parallel.shared()
+    return list(bc._unigram_set_pairs_of(src_toks[start:end], *search_args))
+
+def _tokenize_chunk(args):
+    """
+    splits lines of a chunk into sentence pairs and filters stopwords of
+    both languages. Tokens are given by ids of a chunk vocabulary of their
+    language, numbered in the order of their first occurence (stopwords
+    too), so they can be merged to the corpus vocabulary in order.
+    Returns vocabularies, token ids and sentence lengths without stopwords,
+    and in backup mode the original token ids, lengths and masks of removed
+    stopwords
+    """
+    lines, stopwords, backup = args
+    vocabs = ({}, {})
+    ids = (array("i"), array("i"))
+    lens = (array("i"), array("i"))
+    origs = ((array("i"), array("i"), bytearray()),
+             (array("i"), array("i"), bytearray()))
+    for l in lines:
+        l = l.rstrip("\n")
+        if len(l) == 0:
+            continue
+        src, tgt = l.split("\t")
+
+        #if no-token sentence -> skip it
+        if len(src) == 0 or len(tgt) == 0:
+            continue
+
+        for side, sen in enumerate((src, tgt)):
+            vocab, stop = vocabs[side], stopwords[side]
+            toks = sen.split()
+            sen_ids = [vocab.setdefault(tok, len(vocab)) for tok in toks]
+            if len(stop) > 0:
+                removed = bytearray(tok in stop for tok in toks)
+                kept = [i for i, r in izip(sen_ids, removed) if not r]
+            else:
+                removed, kept = bytearray(len(toks)), sen_ids
+            ids[side].extend(kept)
+            lens[side].append(len(kept))
+            if backup:
+                orig_ids, orig_lens, orig_removed = origs[side]
+                orig_ids.extend(sen_ids)
+                orig_lens.append(len(sen_ids))
+                orig_removed.extend(removed)
+
+    words = []
+    for vocab in vocabs:
+        side_words = [None] * len(vocab)
+        for tok, i in vocab.iteritems():
+            side_words[i] = tok
+        words.append(side_words)
+    return words, ids, lens, (origs if backup else None)
+
+def open_file(path):
+    """ opens a plain, gzip, bzip2 or xz compressed file, based on its
+    first bytes """
+    f = open(path, "rb")
+    magic = f.read(6)
+    f.close()
+    if magic.startswith("\x1f\x8b"):
+        import gzip
+        return gzip.open(path, "rb")
+    elif magic.startswith("BZh"):
+        import bz2
+        return bz2.BZ2File(path, "rb")
+    elif magic == "\xfd7zXZ\x00":
+        # xz needs the lzma module (backports.lzma on python 2)
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                raise IOError("{0} is xz compressed, reading it needs the " \
+                    "backports.lzma module".format(path))
+        return lzma.open(path, "rb")
+    return open(path)
 
 class BiCorpus:
-    def __init__(self, backup=False, int_tokens=False):
-        self._src = Corpus(backup, int_tokens)
-        self._tgt = Corpus(backup, int_tokens)
+    # with --incremental the cache is still rebuilt, if more than this part
+    # of sentence pairs is affected by a removal, because updating a
+    # sentence pair costs about as much as counting two or three of them
+    incremental_rebuild_ratio = 0.25
+    # with --bitsets only tokens of at least this many occurences are
+    # searched on bitsets. Rarer ones are matched only to single tokens (see
+    # _unigram_set_pairs_of()), where converting them costs more than it saves
+    bitset_min_occ = 21
+
+    def __init__(self, backup=False, int_tokens=False, compact_index=False,
+                 positional=False, flat=False, incremental=False,
+                 cache_engine="python", workers=1, topk_error=0.01,
+                 ngram_cache_size=0, bitsets=False, parallel=PARALLEL_PHASES):
+        self._src = Corpus(backup, int_tokens, compact_index, positional, flat,
+                           ngram_cache_size)
+        self._tgt = Corpus(backup, int_tokens, compact_index, positional, flat,
+                           ngram_cache_size)
         self._backup = backup
 
+        # keep full cooccurence counts and update them after removals
+        # instead of rebuilding the whole cache
+        self._incremental = incremental
+
+        # python: counting token pair by token pair
+        # sparse: sparse matrix product (needs scipy)
+        # parallel: counting shards of sentences in worker processes
+        # topk: bounded streaming counters, counts of the top cooccurences
+        #       are overestimated by at most topk_error * all cooccurences
+        #       of the word
+        self._cache_engine = cache_engine
+        self._workers = workers
+        self._topk_error = topk_error
+
+        # phases of PARALLEL_PHASES, that use the workers too. The parallel
+        # cache engine uses them independently of this
+        self._parallel = frozenset(parallel)
+
+        # occurences of tokens are converted to compressed bitsets in
+        # unigram set pair search, see bitset.Bitset
+        self._bitsets = bitsets
+
+    def in_parallel(self, phase):
+        """ whether phase runs in worker processes """
+        return self._workers > 1 and phase in self._parallel
+
     def write(self, out):
         for sen_i in xrange(len(self._src)):
             src_sen, tgt_sen = self._src[sen_i], self._tgt[sen_i]
-            src_str = " ".join(self._src.ints_to_tokens(src_sen.get_tokens(self._backup)))
-            tgt_str = " ".join(self._tgt.ints_to_tokens(tgt_sen.get_tokens(self._backup)))
+            if self._backup:
+                src_str = " ".join(self._src.ints_to_tokens(*src_sen.get_backup()))
+                tgt_str = " ".join(self._tgt.ints_to_tokens(*tgt_sen.get_backup()))
+            else:
+                src_str = " ".join(self._src.ints_to_tokens(src_sen.get_tokens()))
+                tgt_str = " ".join(self._tgt.ints_to_tokens(tgt_sen.get_tokens()))
             out.write("{0}\t{1}\n".format(src_str, tgt_str))
 
     def add_sentence_pair(self, pair):
@@ -30,53 +197,302 @@ class BiCorpus:
             del self._coocc_cache
         if hasattr(self, "interesting"):
             del self.interesting
-        self._coocc_cache = (defaultdict(int), defaultdict(int))
+        # full cooccurence counts keyed by src then tgt token. They are
+        # symmetric, so they are stored only once, interesting keeps the
+        # top of them in both directions
+        self._coocc_cache = defaultdict(dict)
         self.interesting = (defaultdict(dict), defaultdict(dict))
 
-    def build_cache(self):
+    def build_cache(self, max_per_word=10):
         logging.info("Buildind cache...")
         gc.disable()
         self.create_cache()
+        if self._cache_engine == "sparse":
+            self.build_sparse_cache(max_per_word)
+        elif self._cache_engine == "parallel":
+            self.build_parallel_cache()
+            self.filter_interesting_pairs(max_per_word)
+        elif self._cache_engine == "topk":
+            self.build_topk_cache(max_per_word)
+        else:
+            for sen_i in xrange(len(self._src)):
+                if sen_i * 100 / len(self._src) > (sen_i - 1) * 100 / len(self._src):
+                    logging.debug("{0}% done".format(sen_i * 100/len(self._src)))
+                self.add_sentence_pair_to_cache(self._src[sen_i], self._tgt[sen_i])
+            self.filter_interesting_pairs(max_per_word)
+        # full counts are only needed for incremental updates
+        if not self._incremental:
+            self._coocc_cache = None
+        gc.enable()
+        logging.info("Buildind cache done")
+
+    def build_sparse_cache(self, max_per_word=10):
+        """
+        counts cooccurences as a product of sparse sentence-token matrices
+        instead of walking through every token pair in python
+        """
+        # scipy is needed only for this engine
+        from cooccurrence import cooccurrence_matrix, top_per_row
+        from cooccurrence import matrix_to_dicts
+
+        coocc = cooccurrence_matrix(self._src, self._tgt)
+        coocc_t = coocc.T.tocsr()
+        self.interesting = (top_per_row(coocc, max_per_word),
+                            top_per_row(coocc_t, max_per_word))
+        if self._incremental:
+            self._coocc_cache = matrix_to_dicts(coocc)
+
+    def build_parallel_cache(self, shards_per_worker=4):
+        """
+        shards sentences across a process pool, every worker counts
+        cooccurences of its shards, and partial counts are merged here
+        """
+        src_counts = self._coocc_cache
+        partials = parallel.map_shards(_count_shard, len(self._src),
+                                       self._workers, shards_per_worker,
+                                       state=self, ordered=False)
+        for i, partial in enumerate(partials):
+            logging.debug("{0} shards done".format(i + 1))
+            for src_tok, row in partial.iteritems():
+                if src_tok not in src_counts:
+                    src_counts[src_tok] = row
+                    continue
+                merged = src_counts[src_tok]
+                for tgt_tok, count in row.iteritems():
+                    merged[tgt_tok] = merged.get(tgt_tok, 0) + count
+
+    def build_topk_cache(self, max_per_word=10):
+        """
+        streams cooccurences into bounded space-saving counters per token,
+        so the full cooccurence table is never stored
+        """
+        new_summary = lambda: SpaceSaving.with_error(max_per_word,
+                                                     self._topk_error)
+        summaries = (defaultdict(new_summary), defaultdict(new_summary))
         for sen_i in xrange(len(self._src)):
             if sen_i * 100 / len(self._src) > (sen_i - 1) * 100 / len(self._src):
                 logging.debug("{0}% done".format(sen_i * 100/len(self._src)))
-            self.add_sentence_pair_to_cache(self._src[sen_i], self._tgt[sen_i])
-        self.filter_interesting_pairs()
-        gc.enable()
-        logging.info("Buildind cache done")
+            src = self._count_tokens(self._src[sen_i])
+            tgt = self._count_tokens(self._tgt[sen_i])
+            for src_tok, src_c in src.iteritems():
+                summary = summaries[0][src_tok]
+                for tgt_tok, tgt_c in tgt.iteritems():
+                    summary.add(tgt_tok, src_c * tgt_c)
+            for tgt_tok, tgt_c in tgt.iteritems():
+                summary = summaries[1][tgt_tok]
+                for src_tok, src_c in src.iteritems():
+                    summary.add(src_tok, src_c * tgt_c)
+
+        for side in (0, 1):
+            for tok, summary in summaries[side].iteritems():
+                self.interesting[side][tok] = summary.top(max_per_word)
+        # there are no full counts to update incrementally
+        self._coocc_cache = None
 
-    def add_sentence_pair_to_cache(self, src, tgt):
+    @staticmethod
+    def _count_tokens(sen):
+        counts = {}
+        for tok in sen:
+            counts[tok] = counts.get(tok, 0) + 1
+        return counts
+
+    def update_cache(self):
+        """
+        has to be called after removing pairs, rebuilds the cache if it is
+        not maintained incrementally by remove_ngram_pairs()
+        """
+        if self._coocc_cache is None:
+            self.build_cache()
+
+    def add_sentence_pair_to_cache(self, src, tgt, weight=1):
+        cache = self._coocc_cache
         for src_tok in src:
+            row = cache[src_tok]
             for tgt_tok in tgt:
                 try:
-                    self.interesting[0][src_tok][tgt_tok] += 1
-                except KeyError:
-                    self.interesting[0][src_tok][tgt_tok] = 1
-                try:
-                    self.interesting[1][tgt_tok][src_tok] += 1
+                    row[tgt_tok] += weight
                 except KeyError:
-                    self.interesting[1][tgt_tok][src_tok] = 1
+                    row[tgt_tok] = weight
+
+    def remove_from_cache(self, src, tgt):
+        """
+        subtracts cooccurences of src and tgt tokens, that have to be in
+        the cache. Zero counts are dropped, so the cache looks like a
+        freshly built one
+        """
+        if len(tgt) == 0:
+            return
+        cache = self._coocc_cache
+        for src_tok in src:
+            row = cache[src_tok]
+            for tgt_tok in tgt:
+                count = row[tgt_tok] - 1
+                if count == 0:
+                    del row[tgt_tok]
+                else:
+                    row[tgt_tok] = count
+            if len(row) == 0:
+                del cache[src_tok]
+
+    def remove_changes_from_cache(self, old_sens):
+        """
+        subtracts cooccurences of removed tokens from the cache. old_sens
+        is a dict of sentence index -> (src, tgt) tokens before removal.
+        Only removed tokens are counted: old - new cooccurences are
+        removed src x old tgt plus remaining src x removed tgt
+        returns src and tgt tokens, whose counts changed
+        """
+        src_toks, tgt_toks = set(), set()
+        for sen_i, (old_src, old_tgt) in old_sens.iteritems():
+            src, tgt = self._src[sen_i], self._tgt[sen_i]
+            if len(src) == len(old_src) and len(tgt) == len(old_tgt):
+                continue
+            removed_src = self._removed_tokens(old_src, src)
+            removed_tgt = self._removed_tokens(old_tgt, tgt)
+            self.remove_from_cache(removed_src, old_tgt)
+            self.remove_from_cache(src, removed_tgt)
+            if len(removed_src) > 0:
+                src_toks.update(removed_src)
+                tgt_toks.update(old_tgt)
+            if len(removed_tgt) > 0:
+                src_toks.update(src)
+                tgt_toks.update(removed_tgt)
+        return src_toks, tgt_toks
+
+    @staticmethod
+    def _removed_tokens(old, new):
+        """ tokens of old, that are not in new (a part of old) """
+        if len(old) == len(new):
+            return []
+        # sentences are short, so this is faster than counting tokens
+        removed = list(old)
+        for tok in new:
+            removed.remove(tok)
+        return removed
+
+    def cooccurrences_of_tgt(self, tgt_tok):
+        """
+        cooccurence counts of a tgt token with src tokens. The cache is
+        keyed by src tokens, so candidates are collected from the sentences
+        of the tgt token
+        """
+        counts = self._coocc_cache
+        column = {}
+        if tgt_tok not in self._tgt._index:
+            return column
+        for sen_i in self._tgt._index[tgt_tok]:
+            for src_tok in self._src[sen_i]:
+                if src_tok not in column and src_tok in counts:
+                    count = counts[src_tok].get(tgt_tok)
+                    if count is not None:
+                        column[src_tok] = count
+        return column
 
-    def filter_interesting_pairs(self, max_per_word=10):
+    def filter_interesting_pairs(self, max_per_word=10, src_toks=None,
+                                 tgt_toks=None):
+        """
+        fills interesting with the best max_per_word cooccurences of every
+        word, or only of the given words, if they are given after an
+        incremental update (counts can only decrease then)
+        """
         logging.info("Filtering interesting pairs...")
-        
-        for src in self.interesting[0]:
-            self.interesting[0][src] = dict(sorted(self.interesting[0][src].iteritems(), key=lambda x: x[1], reverse=True)[:max_per_word])
-        for tgt in self.interesting[1]:
-            self.interesting[1][tgt] = dict(sorted(self.interesting[1][tgt].iteritems(), key=lambda x: x[1], reverse=True)[:max_per_word])
+        counts = self._coocc_cache
+
+        # ties are broken by token id to be deterministic
+        if src_toks is None:
+            src_toks = counts.keys()
+            updated = lambda tok: None
+        else:
+            updated = lambda tok: self._updated_top_list(
+                self.interesting[0].get(tok), counts[tok].get, max_per_word)
+        for tok in src_toks:
+            if tok in counts:
+                top = updated(tok)
+                if top is None:
+                    top = dict(sorted(counts[tok].iteritems(), key=lambda x: (-x[1], x[0]))[:max_per_word])
+                self.interesting[0][tok] = top
+            elif tok in self.interesting[0]:
+                del self.interesting[0][tok]
+
+        if tgt_toks is None:
+            self.interesting[1].clear()
+            self.interesting[1].update(self._top_per_tgt(max_per_word))
+        else:
+            for tok in tgt_toks:
+                count_of = lambda src_tok: counts[src_tok].get(tok) if src_tok in counts else None
+                top = self._updated_top_list(self.interesting[1].get(tok),
+                                             count_of, max_per_word)
+                if top is None:
+                    column = self.cooccurrences_of_tgt(tok)
+                    top = dict(sorted(column.iteritems(), key=lambda x: (-x[1], x[0]))[:max_per_word])
+                if len(top) > 0:
+                    self.interesting[1][tok] = top
+                elif tok in self.interesting[1]:
+                    del self.interesting[1][tok]
         logging.info("Filtering interesting pairs done")
 
+    @staticmethod
+    def _updated_top_list(top, count_of, max_per_word):
+        """
+        top list of a word after its counts decreased, without counting
+        all of its cooccurences, or None, if it cannot be told this way.
+        count_of(tok) is the current count of tok with the word, or None
+        the list stays the top, if it was not full (so it had every
+        cooccurence), or if none of its tokens dropped below its old worst
+        one, because others could only decrease
+        """
+        if top is None:
+            return {}
+        full = len(top) == max_per_word
+        rank = lambda item: (-item[1], item[0])
+        worst = max(rank(item) for item in top.iteritems())
+        updated = {}
+        for tok in top:
+            count = count_of(tok)
+            if count is None:
+                if full:
+                    return None
+                continue
+            if full and rank((tok, count)) > worst:
+                return None
+            updated[tok] = count
+        return updated
+
+    def _top_per_tgt(self, max_per_word):
+        """
+        best src tokens of every tgt token in one pass over the cache,
+        with a bounded heap per tgt token, so the cache is not transposed
+        """
+        # heap items are (count, reversed src), the smallest is the worst
+        # one, ties are broken by token like in filter_interesting_pairs()
+        heaps = defaultdict(list)
+        for src_tok, row in self._coocc_cache.iteritems():
+            for tgt_tok, count in row.iteritems():
+                heap = heaps[tgt_tok]
+                if len(heap) < max_per_word:
+                    heappush(heap, (count, _ReversedToken(src_tok)))
+                    continue
+                worst_count, worst_src = heap[0]
+                if count > worst_count or (count == worst_count and
+                                           src_tok < worst_src.tok):
+                    heapreplace(heap, (count, _ReversedToken(src_tok)))
+        for tgt_tok, heap in heaps.iteritems():
+            yield tgt_tok, dict((src.tok, count) for count, src in heap)
+
     def ngram_pair_context(self, pair, max_len=None):
         src, tgt = pair
         def __insert_contexts(occ, insterter):
+            if max_len is not None:
+                src_offsets = self._src.ngram_offsets(src, occ)
+                tgt_offsets = self._tgt.ngram_offsets(tgt, occ)
             for sen_index in occ:
                 src_sen = self._src[sen_index]
                 tgt_sen = self._tgt[sen_index]
                 if max_len is None:
                     insterter((src_sen, tgt_sen))
                 else:
-                    src_ngram_indices = src_sen.ngram_positions(src)
-                    tgt_ngram_indices = tgt_sen.ngram_positions(tgt)
+                    src_ngram_indices = src_offsets.get(sen_index, [])
+                    tgt_ngram_indices = tgt_offsets.get(sen_index, [])
                     for src_ngram_index in src_ngram_indices:
                         src_left = max(0, src_ngram_index - max_len)
                         src_right = min(len(src_sen), src_ngram_index + len(src) + max_len)
@@ -101,7 +517,8 @@ class BiCorpus:
 
     def remove_ngram_pairs(self, pairs):
         """
-        this method removes ngram pairs from corpora
+        this method removes ngram pairs from corpora, and returns the number
+        of changed sentence pairs and removed src and tgt tokens
         input is a list because if it were only a pair,
         indices can get corrupted
         cause:
@@ -111,62 +528,158 @@ class BiCorpus:
             sentence because of another index, it cannot be done
         """
         if len(pairs) == 0:
-            return
+            return 0, 0, 0
         logging.info("Removing found pairs")
         gc.disable()
         src_ngram_to_remove = defaultdict(set)
         tgt_ngram_to_remove = defaultdict(set)
+        affected = set()
         for pair in pairs:
             src, tgt = pair
             indices = self._src.ngram_index(src) & self._tgt.ngram_index(tgt)
             if len(indices) > 0:
                 src_ngram_to_remove[src] |= indices
                 tgt_ngram_to_remove[tgt] |= indices
+                affected.update(indices)
 
-        for ngram in src_ngram_to_remove:
-            indices = src_ngram_to_remove[ngram]
-            self._src.remove_ngram(ngram, indices, self._backup)
+        # affected sentences are saved before removing the pairs, and only
+        # cooccurences of removed tokens are subtracted from the cache after
+        incremental = (self._incremental and
+                       getattr(self, "_coocc_cache", None) is not None)
+        rebuild = (incremental and
+                   len(affected) > self.incremental_rebuild_ratio * len(self._src))
+        incremental = incremental and not rebuild
+        if incremental:
+            old_sens = dict((sen_i, (list(self._src[sen_i]),
+                                     list(self._tgt[sen_i])))
+                            for sen_i in affected)
 
-        for ngram in tgt_ngram_to_remove:
-            indices = tgt_ngram_to_remove[ngram]
-            self._tgt.remove_ngram(ngram, indices, self._backup)
+        # removals are grouped by sentence, so every sentence is rewritten
+        # once
+        src_changed, src_removed = self._src.remove_ngrams(
+            self._removals_by_sentence(src_ngram_to_remove), self._backup)
+        tgt_changed, tgt_removed = self._tgt.remove_ngrams(
+            self._removals_by_sentence(tgt_ngram_to_remove), self._backup)
+
+        if incremental:
+            src_toks, tgt_toks = self.remove_changes_from_cache(old_sens)
+            self.filter_interesting_pairs(src_toks=src_toks, tgt_toks=tgt_toks)
         gc.enable() 
+        if rebuild:
+            self.build_cache()
+
+        changed = len(set(src_changed) | set(tgt_changed))
+        logging.info("Removing pairs done. {0} src and {1} tgt tokens " \
+            "removed from {2} sentence pairs.".format(src_removed,
+                                                      tgt_removed, changed))
+        return changed, src_removed, tgt_removed
+
+    @staticmethod
+    def _removals_by_sentence(ngram_to_remove):
+        """ turns ngram -> sentence indices into sentence index -> ngrams.
+        Overlapping ngrams of a sentence depend on the order of removal, so
+        longer ngrams are removed first, then they are ordered by tokens,
+        not by the order of the removed pairs """
+        removals = defaultdict(list)
+        for ngram, indices in ngram_to_remove.iteritems():
+            for sen_i in indices:
+                removals[sen_i].append(ngram)
+        for ngrams in removals.itervalues():
+            ngrams.sort(key=lambda ngram: (-len(ngram), ngram))
+        return removals
 
-        logging.info("Removing pairs done.")
+    @staticmethod
+    def _strdiff_score(src_tok, tgt_tok):
+        """ score of a pair of similar (lowercased) words, or None """
+        if src_tok == tgt_tok:
+            return 1.0
+        if len(src_tok) < 5 or len(tgt_tok) < 5:
+            return None
+        # only distances 1 and 2 matter, so counting can stop above them
+        idiff = bounded_levenshtein(src_tok, tgt_tok, 2)
+        if idiff == 1:
+            return 0.8
+        if len(src_tok) >= 7 and len(tgt_tok) >= 7 and abs(len(tgt_tok) - len(src_tok)) <= 1:
+            if idiff == 2:
+                return 0.6
+        return None
 
-    def get_low_strdiff_pairs(self):
+    def get_low_strdiff_pairs(self, whole_vocab=False):
+        """
+        yields pairs of similar words with similar frequency
+        candidates of a word are its best cooccuring words, or with
+        whole_vocab, every similar word of the target vocabulary, that
+        cooccurs with it
+        """
         logging.info("String difference phase started")
+        if whole_vocab:
+            for pair in self._get_low_strdiff_pairs_in_vocab():
+                yield pair
+            logging.info("String difference phase done")
+            return
+
         src_index = self._src._index
         tgt_index = self._tgt._index
         for src in self.interesting[0]:
             src_tok = self._src.ints_to_tokens([src])[0].lower()
-            for tgt, _ in self.interesting[0][src].iteritems():
-                tgt_tok = self._tgt.ints_to_tokens([tgt])[0].lower()
+            # the most cooccuring similar word is chosen, ties by token
+            for tgt, _ in sorted(self.interesting[0][src].iteritems(),
+                                 key=lambda x: (-x[1], x[0])):
                 ratio = float(len(src_index[src])) / len(tgt_index[tgt])
                 if ratio > 3 or ratio < 1/3.0:
                     continue
 
-                #if idiff == 0:
-                if src_tok == tgt_tok:
-                    logging.debug("{0} added".format(repr((src_tok, tgt_tok))))
-                    yield ((src,), (tgt,)), 1.0
+                tgt_tok = self._tgt.ints_to_tokens([tgt])[0].lower()
+                score = self._strdiff_score(src_tok, tgt_tok)
+                if score is not None:
+                    logging.debug("{0} added ({1})".format(repr((src_tok, tgt_tok)), score))
+                    yield ((src,), (tgt,)), score
                     break
 
-                idiff = levenshtein(src_tok, tgt_tok)
-                #sdiff = levenshtein(src_tok, tgt_tok, 1)
-                if len(src_tok) >= 5 and len(tgt_tok) >= 5:
-                    if idiff == 1:
-                        logging.debug("{0} = {1} added".format(repr((src_tok, tgt_tok)), idiff))
-                        yield ((src,), (tgt,)), 0.8
-                        break
-                if len(src_tok) >= 7 and len(tgt_tok) >= 7 and abs(len(tgt_tok) - len(src_tok)) <= 1:
-                    if idiff == 2:
-                        logging.debug("{0} = {1} added".format(repr((src_tok, tgt_tok)), idiff))
-                        yield ((src,), (tgt,)), 0.6
-                        break
-
         logging.info("String difference phase done")
 
+    def _get_low_strdiff_pairs_in_vocab(self):
+        src_index = self._src._index
+        tgt_index = self._tgt._index
+
+        # words shorter than 5 characters can only be equal, longer ones are
+        # looked up in a deletion index
+        equal = defaultdict(list)
+        close = DeletionIndex(2)
+        for tgt in tgt_index:
+            tgt_tok = self._tgt.ints_to_tokens([tgt])[0].lower()
+            equal[tgt_tok].append(tgt)
+            if len(tgt_tok) >= 5:
+                close.add(tgt_tok, tgt)
+
+        for src in src_index:
+            src_tok = self._src.ints_to_tokens([src])[0].lower()
+            if len(src_tok) >= 5:
+                candidates = [tgt for tgt, _ in close.search(src_tok)]
+            else:
+                candidates = equal.get(src_tok, [])
+
+            best = None
+            for tgt in candidates:
+                ratio = float(len(src_index[src])) / len(tgt_index[tgt])
+                if ratio > 3 or ratio < 1/3.0:
+                    continue
+                tgt_tok = self._tgt.ints_to_tokens([tgt])[0].lower()
+                score = self._strdiff_score(src_tok, tgt_tok)
+                if score is None:
+                    continue
+                coocc = len(src_index[src] & tgt_index[tgt])
+                if coocc == 0:
+                    continue
+                # the most similar, then the most cooccuring word
+                key = (score, coocc, -tgt)
+                if best is None or key > best[0]:
+                    best = key, tgt
+            if best is not None:
+                (score, _, _), tgt = best
+                logging.debug("{0} added ({1})".format(repr((src, tgt)), score))
+                yield ((src,), (tgt,)), score
+
     def generate_unigram_pairs(self, min_coocc=1, max_coocc=None):
         """
         Generates unigram pairs based on results of generate_unigram_set_pairs()
@@ -183,50 +696,117 @@ class BiCorpus:
                 tgt_ngram = tgt_ngram_set.pop()
                 yield ((src_ngram, tgt_ngram), table)
 
-    def __generate_unigram_set_pairs(self, min_coocc=1, max_coocc=None, min_len=1, max_len=3, reverse=False):
+    def __generate_unigram_set_pairs(self, min_coocc=1, max_coocc=None, min_len=1, max_len=3, reverse=False, reachable=None, bitsets=None):
         """
         Walks through cooccurences of one source token and target token sets
         and yields their contingency table
         Example yield:
             (set([src_tok_1]), set([tgt_tok_1, tgt_tok_n]), cont_table)
         right now only one of src and tgt sets can be longer than 1 (based on reverse)
+        if reachable is given, it is a function of a contingency table, that
+        tells if its score can reach the bound. Sets are skipped, if even the
+        best table possible for them cannot (the score has to be increasing
+        in cooccurences and decreasing in target occurences)
+        bitsets are caches of token bitsets, see _unigram_set_pairs_of()
         """
-        if reverse is False:
-            src_index = self._src._index
-            tgt_index = self._tgt._index
-            interesting = self.interesting[0]
-        else:
-            src_index = self._tgt._index
-            tgt_index = self._src._index
-            interesting = self.interesting[1]
+        src_index = self._set_search_sides(reverse)[0]
+        search_args = (min_coocc, max_coocc, min_len, max_len, reverse,
+                       reachable, bitsets)
         gc.disable()
+        if self.in_parallel("search"):
+            results_of_toks = self._parallel_unigram_set_pairs(
+                list(src_index), search_args)
+        else:
+            results_of_toks = self._unigram_set_pairs_of(src_index,
+                                                         *search_args)
         src_len = len(src_index)
-        for i, src_tok in enumerate(src_index):
+        for i, results in enumerate(results_of_toks):
             if i * 100 / src_len < (i + 1) * 100 / src_len:
                 logging.info("{0}% done.".format((i+1)*100 / src_len))
+            yield results
+        gc.enable()
 
+    def _set_search_sides(self, reverse):
+        """ index of searched tokens, index of their candidates, and top
+        cooccurences of searched tokens """
+        if reverse is False:
+            return self._src._index, self._tgt._index, self.interesting[0]
+        else:
+            return self._tgt._index, self._src._index, self.interesting[1]
+
+    def _unigram_set_pairs_of(self, src_toks, min_coocc, max_coocc, min_len,
+                              max_len, reverse, reachable=None, bitsets=None):
+        """ yields set pair results of every token in src_toks, see
+        __generate_unigram_set_pairs()
+        bitsets is a pair of source and target side caches of token bitsets
+        """
+        src_index, tgt_index, interesting = self._set_search_sides(reverse)
+        n = len(self._src)
+        if bitsets is not None:
+            src_bitsets, tgt_bitsets = (bitsets if reverse is False
+                                        else bitsets[::-1])
+        for src_tok in src_toks:
             src_occ = src_index[src_tok] 
 
-            possible_tgts = interesting[src_tok].items()
-            sum_ = sum((x[1] for x in possible_tgts))
-            sorted_possible_tgts = sorted((x for x in possible_tgts if x[1] >= sum_ / 10), key=lambda x: x[1], reverse=True)[:max_len+2]
+            sorted_possible_tgts = self._possible_tgts(interesting, src_tok, max_len + 2)
+
+            use_bitsets = (bitsets is not None and
+                           len(src_occ) >= self.bitset_min_occ)
+            if use_bitsets:
+                # unions and intersections of frequent tokens are the
+                # bottleneck here, so they are done on bitsets
+                if src_tok not in src_bitsets:
+                    src_bitsets[src_tok] = Bitset.from_indices(src_occ)
+                src_occ = src_bitsets[src_tok]
+                for tgt_tok, _ in sorted_possible_tgts:
+                    if tgt_tok not in tgt_bitsets:
+                        tgt_bitsets[tgt_tok] = Bitset.from_indices(tgt_index[tgt_tok])
+                tgt_occs = tgt_bitsets
+                empty_occ = Bitset
+            else:
+                tgt_occs = tgt_index
+                # unions of compact postings stay sorted arrays
+                empty_occ = self._src._posting_type
+
+            if reachable is not None and max_len > 1 and len(src_occ) > 20:
+                # cooccurences of candidates one by one, they bound the
+                # cooccurence of their unions from both sides
+                single_coocc = {}
+                for tgt_tok, _ in sorted_possible_tgts:
+                    if use_bitsets:
+                        single_coocc[tgt_tok] = src_occ.intersection_len(tgt_occs[tgt_tok])
+                    else:
+                        single_coocc[tgt_tok] = len(src_occ & tgt_occs[tgt_tok])
 
             results = []
             for subset_len in xrange(min_len, max_len + 1):
                 for tgt_toks in combinations(sorted_possible_tgts, subset_len):
-                    tgt_occ = set()
+                    tgt_occ = empty_occ()
                     if subset_len > 1:
                         # speedup: if we want to match a word for a set of others, we
                         # filter low frequency words
                         if len(src_occ) <= 20:
                             break
+
+                        # branch and bound: a set is skipped without counting
+                        # its union, if it surely passes coocc bounds (or
+                        # else it would stop the search) and cannot reach
+                        # the score bound
+                        if reachable is not None:
+                            coocc_max = min(len(src_occ), sum(single_coocc[tgt_tok] for tgt_tok, _ in tgt_toks))
+                            coocc_min = max(single_coocc[tgt_tok] for tgt_tok, _ in tgt_toks)
+                            if (coocc_min >= min_coocc and (max_coocc is None or coocc_max <= max_coocc)):
+                                tgt_c = max(coocc_max, max(len(tgt_occs[tgt_tok]) for tgt_tok, _ in tgt_toks))
+                                best_table = (coocc_max, len(src_occ) - coocc_max, tgt_c - coocc_max, n - len(src_occ) - tgt_c + coocc_max)
+                                if not reachable(best_table):
+                                    continue
                         
                         # creating union of sets
                         # check if there are at least two independent occurences
                         # of every token
                         gain_for_every_word = True
                         for tgt_tok, _ in tgt_toks:
-                            tgt_set = tgt_index[tgt_tok]
+                            tgt_set = tgt_occs[tgt_tok]
                             prev_len = len(tgt_occ)
                             tgt_occ |= tgt_set
                             # if gain is too small, there is no point in continuing
@@ -238,8 +818,11 @@ class BiCorpus:
                             continue
 
                     else:
-                        tgt_occ = tgt_index[tgt_toks[0][0]]
-                    coocc = len(src_occ & tgt_occ)
+                        tgt_occ = tgt_occs[tgt_toks[0][0]]
+                    if use_bitsets:
+                        coocc = src_occ.intersection_len(tgt_occ)
+                    else:
+                        coocc = len(src_occ & tgt_occ)
 
                     # if results are ok, yield them with contingency table
                     if (coocc >= min_coocc and (max_coocc is None or coocc <= max_coocc)):
@@ -251,13 +834,91 @@ class BiCorpus:
                     else:
                         break
             yield results
-        gc.enable()
 
-    def generate_unigram_set_pairs(self, min_coocc=1, max_coocc=None, min_len=1, max_len=3, both_ways=True):
-        for _ in self.__generate_unigram_set_pairs(min_coocc, max_coocc, min_len, max_len, False):
+    def _parallel_unigram_set_pairs(self, src_toks, search_args,
+                                    shards_per_worker=16):
+        """
+        splits src_toks into shards, searches them in a process pool, and
+        yields results in the order of src_toks
+        shards are small, because the cost of tokens differs a lot
+        """
+        for results_of_shard in parallel.map_shards(
+                _search_set_pair_shard, len(src_toks), self._workers,
+                shards_per_worker, state=(self, src_toks, search_args)):
+            for results in results_of_shard:
+                yield results
+
+    @staticmethod
+    def _possible_tgts(interesting, src_tok, max_num):
+        """
+        best cooccuring tokens of src_tok, that have at least tenth of
+        all cooccurences of the top list
+        """
+        possible_tgts = interesting[src_tok].items()
+        sum_ = sum((x[1] for x in possible_tgts))
+        # ties are broken by token, not by the order of interesting, that
+        # differs after incremental updates or loading a snapshot
+        return sorted((x for x in possible_tgts if x[1] >= sum_ / 10), key=lambda x: (-x[1], x[0]))[:max_num]
+
+    def unigram_contingency_tables(self, min_coocc=1, max_coocc=None):
+        """
+        batch version of generate_unigram_pairs(): collects every candidate
+        pair from interesting, counts their cooccurences by intersecting
+        their occurences, and builds their contingency tables in one
+        vectorized pass
+        returns arrays of src and tgt token ids of pairs and an (N x 4)
+        array of their (coocc, only_src, only_tgt, others) rows
+        """
+        # numpy is needed only in batch mode
+        import numpy
+
+        src_index, tgt_index = self._src._index, self._tgt._index
+        src_ids, tgt_ids, first = [], [], []
+        for src_tok in src_index:
+            possible_tgts = self._possible_tgts(self.interesting[0], src_tok, 3)
+            for i, (tgt_tok, _) in enumerate(possible_tgts):
+                src_ids.append(src_tok)
+                tgt_ids.append(tgt_tok)
+                first.append(i == 0)
+
+        n = len(self._src)
+        # candidates are a few per src token, so intersecting their
+        # occurences (hashing or merging sorted postings) is cheaper than
+        # building and indexing token x sentence matrices
+        coocc = numpy.fromiter((len(src_index[src_tok] & tgt_index[tgt_tok])
+                                for src_tok, tgt_tok in izip(src_ids, tgt_ids)),
+                               dtype=numpy.int64, count=len(src_ids))
+        src_c = numpy.array([len(src_index[tok]) for tok in src_ids],
+                            dtype=numpy.int64)
+        tgt_c = numpy.array([len(tgt_index[tok]) for tok in tgt_ids],
+                            dtype=numpy.int64)
+        tables = numpy.column_stack((coocc, src_c - coocc, tgt_c - coocc,
+                                     n - src_c - tgt_c + coocc))
+
+        # candidates of a src token are checked in order until the first
+        # one out of the coocc bounds, like in generate_unigram_pairs()
+        bad = coocc < min_coocc
+        if max_coocc is not None:
+            bad |= coocc > max_coocc
+        bad = bad.astype(numpy.int64)
+        first = numpy.array(first, dtype=bool)
+        group = numpy.cumsum(first) - 1
+        bad_so_far = numpy.cumsum(bad)
+        bad_before_group = (bad_so_far - bad)[first]
+        keep = (bad_so_far - bad_before_group[group]) == 0
+
+        src_ids = numpy.array(src_ids, dtype=numpy.int64)
+        tgt_ids = numpy.array(tgt_ids, dtype=numpy.int64)
+        return src_ids[keep], tgt_ids[keep], tables[keep]
+
+    def generate_unigram_set_pairs(self, min_coocc=1, max_coocc=None, min_len=1, max_len=3, both_ways=True, reachable=None):
+        # bitsets of both sides are kept for the reverse search, where source
+        # tokens become candidates and candidates are searched
+        bitsets = (({}, {}) if self._bitsets else None)
+        for _ in self.__generate_unigram_set_pairs(min_coocc, max_coocc, min_len, max_len, False, reachable, bitsets):
             yield _
         if both_ways:
-            for _ in self.__generate_unigram_set_pairs(min_coocc, max_coocc, min_len, max_len, True):
+            for _ in self.__generate_unigram_set_pairs(min_coocc, max_coocc, min_len, max_len, True, reachable, bitsets):
                 yield _
 
     def ngram_pair_neighbours(self, pair, ngram_indices=None, max_len=4):
@@ -319,9 +980,21 @@ class BiCorpus:
 
         return (coocc_c, only_src_c, only_tgt_c, others_c)
 
-    def read_from_file(self, f):
+    def read_from_file(self, f, chunk_lines=10000):
+        """
+        reads tab separated sentence pairs from f
+        with int tokens and more workers, chunks of lines are tokenized in
+        worker processes, while the previous chunks are added to the corpus
+        """
         gc.disable()
         logging.info("Reading bicorpus started...")
+        if self.in_parallel("read") and self._src._int_tokens:
+            self._read_parallel(f, chunk_lines)
+            self.build_cache()
+            gc.enable()
+            logging.info("Reading bicorpus done.")
+            return
+
         c = 1
         for l in f:
             if c % 10000 == 0:
@@ -341,6 +1014,139 @@ class BiCorpus:
         gc.enable()
         logging.info("Reading bicorpus done.")
 
+    def _read_parallel(self, f, chunk_lines):
+        # workers filter stopwords by their strings
+        stopwords = tuple(corpus.stopword_tokens()
+                          for corpus in (self._src, self._tgt))
+
+        def read_chunks():
+            chunks = []
+            for _ in xrange(self._workers * 2):
+                chunk = list(islice(f, chunk_lines))
+                if len(chunk) == 0:
+                    break
+                chunks.append((chunk, stopwords, self._backup))
+            return chunks
+
+        pool = Pool(self._workers)
+        try:
+            chunks = read_chunks()
+            pending = (pool.map_async(_tokenize_chunk, chunks) if chunks
+                       else None)
+            while pending is not None:
+                results = pending.get()
+                # next chunks are read and tokenized during merging these
+                chunks = read_chunks()
+                pending = (pool.map_async(_tokenize_chunk, chunks) if chunks
+                           else None)
+                for words, ids, lens, origs in results:
+                    self._add_tokenized_chunk(words, ids, lens, origs)
+                logging.debug("{0} sentence pairs read.".format(len(self._src)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _add_tokenized_chunk(self, words, ids, lens, origs):
+        """ adds sentences tokenized and filtered by _tokenize_chunk(), only
+        their ids are mapped to the corpus vocabulary here """
+        corpora = (self._src, self._tgt)
+        mapped, mapped_origs = [], []
+        for side, corpus in enumerate(corpora):
+            # chunk vocabularies are mapped to corpus vocabularies in order
+            id_map = (corpus.tokens_to_ints(words[side])
+                      if len(words[side]) > 0 else [])
+            mapped.append(map(id_map.__getitem__, ids[side]))
+            if origs is not None:
+                mapped_origs.append(map(id_map.__getitem__, origs[side][0]))
+        starts, orig_starts = [0, 0], [0, 0]
+        for sen_i in xrange(len(lens[0])):
+            for side, corpus in enumerate(corpora):
+                start, l = starts[side], lens[side][sen_i]
+                starts[side] = start + l
+                if origs is None:
+                    corpus.add_filtered_sentence(mapped[side][start:start + l])
+                    continue
+                orig_start = orig_starts[side]
+                orig_end = orig_start + origs[side][1][sen_i]
+                orig_starts[side] = orig_end
+                corpus.add_filtered_sentence(
+                    mapped[side][start:start + l],
+                    mapped_origs[side][orig_start:orig_end],
+                    origs[side][2][orig_start:orig_end])
+
+    def save(self, path, with_index=True, with_cache=True, extra_blocks=None):
+        """
+        saves corpora (and optionally their indices and the cache) to a
+        binary snapshot, that can be loaded with BiCorpus.load()
+        extra_blocks are saved too as marshalled objects (they can be read
+        with snapshot.Snapshot)
+        """
+        logging.info("Saving snapshot to {0}...".format(path))
+        meta = {}
+        blocks = {}
+        for name, corpus in (("src", self._src), ("tgt", self._tgt)):
+            corpus_meta, corpus_blocks = corpus.get_snapshot(with_index)
+            meta[name] = corpus_meta
+            for block_name, block in corpus_blocks.iteritems():
+                blocks[name + "_" + block_name] = block
+        if with_cache and hasattr(self, "interesting"):
+            blocks["interesting"] = tuple(dict(d) for d in self.interesting)
+            if getattr(self, "_coocc_cache", None) is not None:
+                blocks["coocc_cache"] = dict(self._coocc_cache)
+        if extra_blocks is not None:
+            blocks.update(extra_blocks)
+        # an existing file is unlinked instead of truncated, corpora loaded
+        # from it can still have views of its mapping
+        if os.path.exists(path):
+            os.remove(path)
+        f = open(path, "wb")
+        write_snapshot(f, meta, blocks)
+        f.close()
+        logging.info("Saving snapshot done")
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        loads a snapshot saved by save(), kwargs are given to the
+        constructor, so the layout of the loaded corpora can be different
+        from the saved ones
+        """
+        logging.info("Loading snapshot from {0}...".format(path))
+        gc.disable()
+        snapshot = Snapshot(path)
+        bc = cls(int_tokens=True, **kwargs)
+        for name, corpus in (("src", bc._src), ("tgt", bc._tgt)):
+            def blocks(block_name, view=False):
+                block_name = name + "_" + block_name
+                if block_name not in snapshot:
+                    return None
+                return (snapshot.view(block_name) if view
+                        else snapshot.get(block_name))
+            corpus.load_snapshot(snapshot.meta[name], blocks)
+
+        if "interesting" in snapshot and (not bc._incremental or
+                                          "coocc_cache" in snapshot):
+            bc.create_cache()
+            for side, interesting in enumerate(snapshot.get("interesting")):
+                bc.interesting[side].update(interesting)
+            if bc._incremental:
+                bc._coocc_cache.update(snapshot.get("coocc_cache"))
+            else:
+                bc._coocc_cache = None
+        else:
+            bc.build_cache()
+        snapshot.close()
+        gc.enable()
+        logging.info("Loading snapshot done")
+        return bc
+
+    def log_ngram_cache_stats(self):
+        for name, corpus in (("src", self._src), ("tgt", self._tgt)):
+            if corpus._ngram_cache_size == 0:
+                continue
+            logging.info("{0} ngram cache: {1}".format(
+                name, corpus._ngram_cache.stats()))
+
     def set_stopwords(self, src, tgt):
         self._src.set_stopwords(src)
         self._tgt.set_stopwords(tgt)
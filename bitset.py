@@ -0,0 +1,103 @@
+from binascii import hexlify
+import marshal
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# number of set bits of every byte value, as a translate table
+_POPCOUNTS = "".join(chr(bin(byte).count("1")) for byte in xrange(256))
+
+class Bitset(object):
+    """
+    compressed occurence set for unigram set pair search
+    sentence indices are split into chunks of 2^16 sentences, and every
+    non-empty chunk is a python int used as a bitmap (roaring bitmap style,
+    without sparse containers), so unions and intersections work on machine
+    words in C, and counting them is a popcount, without creating sets of
+    boxed ints
+    """
+    __slots__ = ["_chunks", "_len"]
+
+    def __init__(self, chunks=None):
+        self._chunks = ({} if chunks is None else chunks)
+        self._len = None
+
+    @classmethod
+    def from_indices(cls, indices):
+        if isinstance(indices, Bitset):
+            return indices
+        buffers = {}
+        for i in indices:
+            chunk = i >> CHUNK_BITS
+            if chunk not in buffers:
+                buffers[chunk] = bytearray((CHUNK_MASK + 1) / 8)
+            bit = i & CHUNK_MASK
+            buffers[chunk][bit >> 3] |= 1 << (bit & 7)
+        chunks = {}
+        for chunk, buf in buffers.iteritems():
+            # most significant byte first for int parsing
+            buf.reverse()
+            chunks[chunk] = int(hexlify(buf), 16)
+        return cls(chunks)
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(_popcount(bits) for bits in
+                            self._chunks.itervalues())
+        return self._len
+
+    def __iter__(self):
+        for chunk in sorted(self._chunks):
+            bits = self._chunks[chunk]
+            base = chunk << CHUNK_BITS
+            # lowest set bit at a time, so cost is linear in members
+            while bits:
+                low = bits & -bits
+                yield base + low.bit_length() - 1
+                bits ^= low
+
+    def __contains__(self, item):
+        bits = self._chunks.get(item >> CHUNK_BITS, 0)
+        return bool(bits >> (item & CHUNK_MASK) & 1)
+
+    def __or__(self, other):
+        other = Bitset.from_indices(other)
+        chunks = dict(self._chunks)
+        for chunk, bits in other._chunks.iteritems():
+            chunks[chunk] = chunks.get(chunk, 0) | bits
+        return Bitset(chunks)
+    __ror__ = __or__
+
+    def __and__(self, other):
+        other = Bitset.from_indices(other)
+        a, b = self._chunks, other._chunks
+        if len(a) > len(b):
+            a, b = b, a
+        chunks = {}
+        for chunk, bits in a.iteritems():
+            if chunk in b:
+                common = bits & b[chunk]
+                if common:
+                    chunks[chunk] = common
+        return Bitset(chunks)
+    __rand__ = __and__
+
+    def intersection_len(self, other):
+        """ len(self & other) without building the intersection """
+        a, b = self._chunks, other._chunks
+        if len(a) > len(b):
+            a, b = b, a
+        result = 0
+        for chunk, bits in a.iteritems():
+            if chunk in b:
+                result += _popcount(bits & b[chunk])
+        return result
+
+def _popcount(bits):
+    if type(bits) is int:
+        return bin(bits).count("1")
+    # marshalled longs are a type byte, 4 bytes of digit count and the 15
+    # bit digits in 2 bytes each, so their bits are the bits of the long,
+    # and they are counted by a table over bytes. Zero bytes are deleted before
+    # counting, so sparse bitmaps are counted in the time of their members
+    return sum(bytearray(marshal.dumps(bits)[5:].translate(_POPCOUNTS, "\0")))
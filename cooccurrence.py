@@ -0,0 +1,89 @@
+"""
+cooccurence counting with sparse matrices
+the sentence-token incidence matrices of the two sides are built once, and
+their product gives every src-tgt cooccurence count, the same as
+BiCorpus.add_sentence_pair_to_cache() does token pair by token pair
+"""
+
+from collections import defaultdict
+
+import numpy
+from scipy.sparse import csr_matrix
+
+def incidence_matrix(corpus, n_sentences=None):
+    """
+    sentences x tokens matrix, every cell holds the number of occurences
+    of the token in the sentence
+    """
+    if n_sentences is None:
+        n_sentences = len(corpus)
+    if corpus._flat:
+        cols, lens = _flat_tokens(corpus._corpus, n_sentences)
+    else:
+        lens = numpy.zeros(n_sentences, dtype=numpy.int64)
+        toks = []
+        for sen_i in xrange(n_sentences):
+            sen = corpus[sen_i]
+            lens[sen_i] = len(sen)
+            toks.extend(sen)
+        cols = numpy.array(toks, dtype=numpy.int64)
+    rows = numpy.repeat(numpy.arange(n_sentences), lens)
+    data = numpy.ones(len(cols), dtype=numpy.int64)
+    n_tokens = (cols.max() + 1 if len(cols) > 0 else 0)
+    # duplicate entries are summed up when converting to csr
+    return csr_matrix((data, (rows, cols)), shape=(n_sentences, n_tokens))
+
+def _flat_tokens(store, n_sentences):
+    """ live tokens of FlatSentences without going through sentences """
+    tokens = numpy.frombuffer(store._tokens, dtype=numpy.int32)
+    starts = numpy.frombuffer(store._starts, dtype=numpy.int64)[:n_sentences]
+    lens = numpy.frombuffer(store._lens, dtype=numpy.int32)[:n_sentences]
+    lens = lens.astype(numpy.int64)
+    # positions of live tokens: every slot from its start, len long
+    packed_starts = numpy.cumsum(lens) - lens
+    positions = (numpy.arange(lens.sum()) + numpy.repeat(starts - packed_starts,
+                                                         lens))
+    return tokens[positions].astype(numpy.int64), lens
+
+def cooccurrence_matrix(src_corpus, tgt_corpus):
+    """ src tokens x tgt tokens matrix of cooccurence counts """
+    src = incidence_matrix(src_corpus)
+    tgt = incidence_matrix(tgt_corpus, len(src_corpus))
+    coocc = (src.T.tocsr() * tgt).tocsr()
+    coocc.eliminate_zeros()
+    return coocc
+
+def top_per_row(matrix, max_per_word):
+    """
+    selects the best max_per_word columns of every row, ties are broken by
+    column index like in BiCorpus.filter_interesting_pairs()
+    returns a dict of dicts like BiCorpus.interesting
+    """
+    matrix = matrix.tocsr()
+    row_lens = numpy.diff(matrix.indptr)
+    rows = numpy.repeat(numpy.arange(matrix.shape[0]), row_lens)
+    order = numpy.lexsort((matrix.indices, -matrix.data, rows))
+    # rank of every entry inside its own row
+    rank = numpy.arange(len(order)) - numpy.repeat(matrix.indptr[:-1],
+                                                   row_lens)
+    keep = order[rank < max_per_word]
+
+    result = defaultdict(dict)
+    for row, col, count in zip(rows[keep].tolist(),
+                               matrix.indices[keep].tolist(),
+                               matrix.data[keep].tolist()):
+        result[row][col] = count
+    return result
+
+def matrix_to_dicts(matrix):
+    """ full counts as dict of dicts like BiCorpus._coocc_cache """
+    matrix = matrix.tocsr()
+    result = defaultdict(dict)
+    indptr = matrix.indptr.tolist()
+    indices = matrix.indices.tolist()
+    data = matrix.data.tolist()
+    for row in xrange(matrix.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        if start < end:
+            result[row] = dict(zip(indices[start:end], data[start:end]))
+    return result
@@ -1,14 +1,42 @@
 import gc
+from array import array
 from collections import defaultdict
+from itertools import izip, count
 import logging
 
 from sentence import Sentence
+from flatcorpus import FlatSentences
+from postings import PostingList, PositionList
+from postings import encode_position, decode_position
+from lru import LRUCache
 
 class Corpus:
-    def __init__(self, backup, int_tokens=False):
-        self._corpus = []
+    def __init__(self, backup, int_tokens=False, compact_index=False,
+                 positional=False, flat=False, ngram_cache_size=0):
+        # flat storage keeps all tokens in one buffer instead of
+        # Sentence objects, it works only with int tokens
+        self._flat = flat
+        if self._flat:
+            if not int_tokens:
+                raise ValueError("Flat storage needs int tokens")
+            self._corpus = FlatSentences(backup)
+        else:
+            self._corpus = []
+
+        # compact index stores occurences in sorted arrays instead of sets
+        self._posting_type = (PostingList if compact_index else set)
+        # positional index stores (sentence, offset) pairs for every token,
+        # so ngrams can be looked up without scanning sentences
+        self._positional = positional
         self.create_index()
 
+        # LRU cache of ngram -> occurences for ngrams longer than one,
+        # bounded by the number of cached occurences
+        self._ngram_cache_size = ngram_cache_size
+        self._ngram_cache = LRUCache(ngram_cache_size)
+        # first token -> cached ngrams starting with it, for invalidation
+        self._ngram_cache_keys = defaultdict(set)
+
         self._backup = backup
 
         self._int_tokens = int_tokens
@@ -41,31 +69,142 @@ class Corpus:
             sen = self.tokens_to_ints(sen)
 
         # create actual Sentence instance
-        new_sen = Sentence(sen)
-        self._corpus.append(new_sen)
+        if self._flat:
+            new_sen = self._corpus.append(sen)
+        else:
+            new_sen = Sentence(sen)
+            self._corpus.append(new_sen)
 
         # filter stopwords
         if hasattr(self, "_stopwords"):
             new_sen.remove_toks(self._stopwords, self._backup)
+        self._register_sentence(new_sen)
+
+    def add_filtered_sentence(self, toks, orig=None, removed=None):
+        """
+        adds a sentence of token ids, that are already filtered from
+        stopwords (see BiCorpus._read_parallel()). In backup mode orig and
+        removed are the tokens before filtering and the mask of stopwords
+        """
+        if self._flat:
+            new_sen = self._corpus.append(toks, orig, removed)
+        else:
+            new_sen = Sentence(toks)
+            self._corpus.append(new_sen)
+            # add_sentence() keeps a backup after filtering stopwords
+            if self._backup and hasattr(self, "_stopwords"):
+                new_sen.set_backup(orig, removed)
+        self._register_sentence(new_sen)
 
-        # register to index
+    def _register_sentence(self, new_sen):
+        """ registers the last added sentence to the index """
+        self._invalidate_ngram_cache(new_sen)
         sen_index = len(self._corpus) - 1
         for tok in new_sen:
             self._index[tok].add(sen_index)
+        if self._positional:
+            for offset, tok in enumerate(new_sen):
+                self._pos_index[tok].add(encode_position(sen_index, offset))
 
     def create_index(self):
-        self._index = defaultdict(set)
+        self._index = defaultdict(self._posting_type)
         for i, sen in enumerate(self._corpus):
             for tok in sen:
                 self._index[tok].add(i)
+        if self._positional:
+            self.create_positional_index()
+
+    def create_positional_index(self):
+        self._pos_index = defaultdict(PositionList)
+        for i, sen in enumerate(self._corpus):
+            for offset, tok in enumerate(sen):
+                self._pos_index[tok].add(encode_position(i, offset))
+
+    def ngram_positions(self, ngram):
+        """
+        returns encoded positions of ngram occurences in the corpus,
+        computed by merging position lists of ngram tokens
+        """
+        if self._int_tokens:
+            ngram = self.tokens_to_ints(ngram)
+        if ngram[0] not in self._pos_index:
+            return PositionList()
+        positions = self._pos_index[ngram[0]]
+        for shift, tok in enumerate(ngram[1:], 1):
+            if tok not in self._pos_index:
+                return PositionList()
+            positions = positions.followed_by(self._pos_index[tok], shift)
+        return positions
+
+    def ngram_offsets(self, ngram, indices=None):
+        """
+        returns a dict of sentence index -> start offsets of ngram
+        if indices is given, only those sentences are regarded
+        """
+        if self._int_tokens:
+            ngram = self.tokens_to_ints(ngram)
+        offsets = defaultdict(list)
+        if self._positional:
+            for pos in self.ngram_positions(ngram):
+                sen_i, offset = decode_position(pos)
+                if indices is None or sen_i in indices:
+                    offsets[sen_i].append(offset)
+        else:
+            if indices is None:
+                indices = self.ngram_index(ngram)
+            for sen_i in indices:
+                positions = self._corpus[sen_i].ngram_positions(ngram)
+                if positions:
+                    offsets[sen_i] = positions
+        return offsets
     
     def ngram_index(self, ngram):
+        """
+        returns sentence indices of ngram occurences
+        results of longer ngrams can come from a cache, they must not be
+        modified
+        """
         if self._int_tokens:
             ngram = self.tokens_to_ints(ngram)
+        if len(ngram) == 1 or self._ngram_cache_size == 0:
+            return self._ngram_index(ngram)
+
+        key = tuple(ngram)
+        occ = self._ngram_cache.get(key)
+        if occ is not None:
+            return occ
+
+        occ = self._ngram_index(ngram)
+        self._ngram_cache_keys[key[0]].add(key)
+        for old_key in self._ngram_cache.put(key, occ):
+            self._ngram_cache_keys[old_key[0]].discard(old_key)
+        return occ
+
+    def _invalidate_ngram_cache(self, toks):
+        """
+        drops cached ngrams, that can have a changed occurence in a sentence
+        with toks. Every such ngram consists of tokens of the sentence before
+        the change, so it is enough to check first tokens
+        """
+        # every cached ngram has its first token here
+        if len(self._ngram_cache_keys) == 0:
+            return
+        for tok in set(toks):
+            if tok in self._ngram_cache_keys:
+                for key in self._ngram_cache_keys.pop(tok):
+                    self._ngram_cache.discard(key)
+
+    def _ngram_index(self, ngram):
         if ngram[0] not in self._index:
-            return set()
+            return self._posting_type()
+
+        if self._positional and len(ngram) > 1:
+            valid_occ = self._posting_type()
+            for pos in self.ngram_positions(ngram):
+                valid_occ.add(decode_position(pos)[0])
+            return valid_occ
 
-        occ = set(self._index[ngram[0]])
+        occ = self._index[ngram[0]].copy()
             
         if len(ngram) == 1:
             return occ
@@ -73,7 +212,7 @@ class Corpus:
         for tok in ngram[1:]:
             occ = occ & self._index[tok]
                                                 
-        valid_occ = set()
+        valid_occ = self._posting_type()
         for sen_i in occ:
             sen = self._corpus[sen_i]
             if sen.ngram_positions(ngram):
@@ -87,29 +226,73 @@ class Corpus:
             ngram = self.tokens_to_ints(ngram)
 
         neighbours = defaultdict(int)
+        offsets = self.ngram_offsets(ngram, indices)
         for sen_i in indices:
+            if sen_i not in offsets:
+                continue
             sen = self._corpus[sen_i]
-            for pos in sen.ngram_positions(ngram):
+            for pos in offsets[sen_i]:
                 if pos > 0:
                     neighbours[(sen[pos - 1], -1)] += 1
                 if pos + len(ngram) < len(sen):
                     neighbours[(sen[pos + len(ngram)], 1)] += 1
-        return sorted(filter(lambda x: x[1] > 1, neighbours.items()), key=lambda x: x[1], reverse=True)[:top_n]
+        # ties are broken by the neighbour, so the result does not depend on
+        # the iteration order of indices
+        return sorted(filter(lambda x: x[1] > 1, neighbours.items()), key=lambda x: (-x[1], x[0]))[:top_n]
 
     def remove_ngram(self, ngram, ind=None, backup=False):
         ngram = self.tokens_to_ints(ngram)
         if ind is None:
             ind = self.ngram_index(ngram)
-        for sen_i in ind:
-            sen = self._corpus[sen_i]
-            sen.remove_ngram(ngram, backup)
+        return self.remove_ngrams(dict((sen_i, [ngram]) for sen_i in ind),
+                                  backup)
+
+    def remove_ngrams(self, removals, backup=False):
+        """
+        removals is a dict of sentence index -> ngrams to remove from the
+        sentence (in this order). Every sentence is rewritten and reindexed
+        only once, after all of its ngrams are removed
+        returns indices of changed sentences and the number of removed tokens
+        """
+        changed = []
+        removed_toks = 0
+        for sen_i, ngrams in removals.iteritems():
+            # flat storage is rewritten once from a temporary Sentence
+            sen = (self._corpus.load(sen_i) if self._flat
+                   else self._corpus[sen_i])
+            old_toks = list(sen)
+            for ngram in ngrams:
+                sen.remove_ngram(self.tokens_to_ints(ngram), backup)
+            if len(sen) == len(old_toks):
+                continue
+
+            if self._flat:
+                self._corpus.store(sen_i, sen)
+            changed.append(sen_i)
+            removed_toks += len(old_toks) - len(sen)
+            if self._positional:
+                self._update_positions(sen_i, old_toks, sen)
+            self._invalidate_ngram_cache(old_toks)
 
-            # maintaining index
-            #for tok in ngram:
-                #if not tok in sen:
-                    #self._index[tok].remove(sen_i)
-                    #if len(self._index[tok]) == 0:
-                        #del self._index[tok]
+            # maintaining index in every mode, not only incrementally:
+            # contingency tables of later iterations count occurences from
+            # the index, and they have to be counted in the reduced corpus
+            # like cooccurences in the cache, not in sentences the token was
+            # already removed from
+            for tok in set(old_toks).difference(sen):
+                if tok in self._index:
+                    self._index[tok].discard(sen_i)
+                    if len(self._index[tok]) == 0:
+                        del self._index[tok]
+        return changed, removed_toks
+
+    def _update_positions(self, sen_i, old_toks, new_toks):
+        # every offset can change after a removal, so all positions
+        # of the sentence are registered again
+        for offset, tok in enumerate(old_toks):
+            self._pos_index[tok].discard(encode_position(sen_i, offset))
+        for offset, tok in enumerate(new_toks):
+            self._pos_index[tok].add(encode_position(sen_i, offset))
 
     def tokens_to_ints(self, tokens):
         # sometimes tokens are already changed
@@ -123,7 +306,7 @@ class Corpus:
             ints.append(self._tokmap[tok])
         return ints
 
-    def ints_to_tokens(self, ints):
+    def ints_to_tokens(self, ints, removed=None):
         # first check, if there is a reverse dict
         if not hasattr(self, "_reverse_tokmap"):
             logging.info("Creating reverse tokmap for corpus...")
@@ -133,16 +316,29 @@ class Corpus:
             logging.info("Creating reverse tokmap for corpus done")
 
         tokens = []
-        for i in ints:
+        for j, i in enumerate(ints):
+            # removed tokens in backup mode, given by a mask
+            if removed is not None and removed[j]:
+                tokens.append("[{0}]".format(self._reverse_tokmap[i]))
+
             # normal tokens
-            if type(i) == int:
+            elif type(i) == int:
                 tokens.append(self._reverse_tokmap[i])
 
-            # removed tokens in backup mode
+            # removed tokens in backup mode, in 1-tuples
             else:
                 tokens.append("[{0}]".format(self._reverse_tokmap[i[0]]))
         return tokens
 
+    def stopword_tokens(self):
+        """ set of stopwords as strings """
+        if not hasattr(self, "_stopwords"):
+            return set()
+        if not self._int_tokens:
+            return set(self._stopwords)
+        return set(tok for tok, i in self._tokmap.iteritems()
+                   if i in self._stopwords)
+
     def set_stopwords(self, stopwords):
         if len(stopwords) != 0:
             if self._int_tokens:
@@ -150,6 +346,108 @@ class Corpus:
             else:
                 self._stopwords = set(stopwords)
 
+    def get_snapshot(self, with_index=True):
+        """
+        returns (meta, blocks) for snapshot.write_snapshot(), containing
+        vocabulary, stopwords, sentences (as token ids and lengths), backup
+        sentences and optionally the index
+        """
+        if not self._int_tokens:
+            raise ValueError("Only int token corpora can be saved")
+        vocabulary = [None] * len(self._tokmap)
+        for tok, i in self._tokmap.iteritems():
+            vocabulary[i] = tok
+        meta = {"vocabulary": vocabulary}
+        if hasattr(self, "_stopwords"):
+            meta["stopwords"] = list(self._stopwords)
+
+        blocks = {}
+        tokens, lens = array("i"), array("i")
+        for sen in self._corpus:
+            tokens.extend(sen)
+            lens.append(len(sen))
+        blocks["tokens"], blocks["lens"] = tokens, lens
+
+        if self._backup:
+            orig, orig_lens, removed = array("i"), array("i"), array("B")
+            for sen in self._corpus:
+                sen_orig, sen_removed = sen.get_backup()
+                orig.extend(sen_orig)
+                removed.fromstring(str(sen_removed))
+                orig_lens.append(len(sen_orig))
+            blocks["orig"], blocks["orig_lens"] = orig, orig_lens
+            blocks["removed"] = removed
+
+        if with_index:
+            index_toks, index_lens = array("i"), array("l")
+            postings = array("i")
+            for tok in sorted(self._index):
+                index_toks.append(tok)
+                index_lens.append(len(self._index[tok]))
+                postings.extend(sorted(self._index[tok]))
+            blocks["index_toks"], blocks["index_lens"] = index_toks, index_lens
+            blocks["postings"] = postings
+        return meta, blocks
+
+    def load_snapshot(self, meta, blocks):
+        """
+        fills an empty corpus from a snapshot, blocks is a function, that
+        returns a block by its name or None, if it is not in the snapshot,
+        and with view=True a view of it instead of a copy (see
+        snapshot.Snapshot.view()). Flat storage keeps views of the sentences.
+        Layout (flat storage, index type, backup) is the one of this corpus,
+        not the one of the saved corpus
+        """
+        self._tokmap = dict(izip(meta["vocabulary"], count()))
+        if "stopwords" in meta:
+            self._stopwords = set(meta["stopwords"])
+
+        tokens = blocks("tokens", view=self._flat)
+        lens = blocks("lens", view=self._flat)
+        orig, orig_lens, removed = None, None, None
+        if self._backup:
+            orig = blocks("orig", view=self._flat)
+            if orig is not None:
+                orig_lens = blocks("orig_lens")
+                removed = bytearray(blocks("removed").tostring())
+            else:
+                # removed tokens were not saved, backup starts from the
+                # current tokens
+                orig, orig_lens = array("i", tokens), array("i", lens)
+                removed = bytearray(len(tokens))
+
+        if self._flat:
+            self._corpus = FlatSentences.from_arrays(tokens, lens, self._backup,
+                                                     orig, orig_lens, removed)
+        else:
+            self._corpus = []
+            start, orig_start = 0, 0
+            for sen_i, l in enumerate(lens):
+                sen = Sentence(tokens[start:start + l])
+                start += l
+                if self._backup:
+                    orig_end = orig_start + orig_lens[sen_i]
+                    sen.set_backup(orig[orig_start:orig_end],
+                                   removed[orig_start:orig_end])
+                    orig_start = orig_end
+                self._corpus.append(sen)
+
+        index_toks = blocks("index_toks")
+        if index_toks is None:
+            self.create_index()
+            return
+        index_lens, postings = blocks("index_lens"), blocks("postings")
+        self._index = defaultdict(self._posting_type)
+        start = 0
+        for tok, l in izip(index_toks, index_lens):
+            if self._posting_type is PostingList:
+                self._index[tok] = PostingList(postings[start:start + l])
+            else:
+                self._index[tok] = set(postings[start:start + l])
+            start += l
+        if self._positional:
+            self.create_positional_index()
+
     def clean_multiple_hapax_sentences(self):
         # TODO implement if needed
         pass
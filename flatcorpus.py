@@ -0,0 +1,221 @@
+from array import array
+
+from sentence import Sentence, ngram_positions
+
+class FlatSentences(object):
+    """
+    storage for the sentences of a Corpus, that keeps every token id in one
+    contiguous buffer with a sentence offset table (CSR layout) instead of
+    one Sentence object (and one list) per sentence
+
+    every sentence owns a slot in the buffer, that is as long as the
+    sentence was at insertion. Removals rewrite tokens inside the slot and
+    only the length changes, so offsets of other sentences are never touched
+
+    in backup mode the original tokens are kept in a second buffer with a
+    mask of removed tokens
+
+    buffers can be views of a snapshot (see snapshot.Snapshot.view()), they
+    are copied to arrays only if a sentence is appended
+    """
+    def __init__(self, backup=False):
+        self._tokens = array("i")
+        self._starts = array("l")
+        self._lens = array("i")
+
+        self._backup = backup
+        if self._backup:
+            self._orig = array("i")
+            self._orig_starts = array("l")
+            self._removed = bytearray()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        for i in xrange(len(self._starts)):
+            yield SentenceView(self, i)
+
+    def __reversed__(self):
+        for i in xrange(len(self._starts) - 1, -1, -1):
+            yield SentenceView(self, i)
+
+    def __getitem__(self, key):
+        if key < 0:
+            key += len(self._starts)
+        if key < 0 or key >= len(self._starts):
+            raise IndexError("sentence index out of range")
+        return SentenceView(self, key)
+
+    @classmethod
+    def from_arrays(cls, tokens, lens, backup=False, orig=None,
+                    orig_lens=None, removed=None):
+        """ builds storage from packed tokens and sentence lengths, tokens,
+        lens and orig can be snapshot views """
+        store = cls(backup)
+        store._tokens = tokens
+        store._lens = lens
+        store._starts = _starts_of(lens)
+        if backup:
+            store._orig = orig
+            store._orig_starts = _starts_of(orig_lens)
+            store._removed = removed
+        return store
+
+    def append(self, tokens, orig=None, removed=None):
+        """ appends a sentence, in backup mode orig and removed can be the
+        original tokens and the mask of removed ones, if some are already
+        filtered """
+        if not isinstance(self._tokens, array):
+            self._copy_views()
+        tokens = array("i", tokens)
+        self._starts.append(len(self._tokens))
+        self._lens.append(len(tokens))
+        if self._backup:
+            self._orig_starts.append(len(self._orig))
+            if orig is None:
+                self._orig.extend(tokens)
+                self._removed.extend("\0" * len(tokens))
+            else:
+                self._orig.extend(array("i", orig))
+                self._removed.extend(removed)
+        self._tokens.extend(tokens)
+        return SentenceView(self, len(self._starts) - 1)
+
+    def _copy_views(self):
+        """ replaces views of a snapshot with arrays """
+        self._tokens = _array_of(self._tokens)
+        self._lens = _array_of(self._lens)
+        if self._backup:
+            self._orig = _array_of(self._orig)
+
+    def get(self, i):
+        start = self._starts[i]
+        return self._tokens[start:start + self._lens[i]]
+
+    def get_backup(self, i):
+        """ original tokens of sentence and the mask of removed ones """
+        start = self._orig_starts[i]
+        if i + 1 < len(self._orig_starts):
+            end = self._orig_starts[i + 1]
+        else:
+            end = len(self._orig)
+        return self._orig[start:end], self._removed[start:end]
+
+    def set(self, i, tokens):
+        """ overwrites sentence with tokens, that cannot be longer than its
+        original length """
+        start = self._starts[i]
+        if i + 1 < len(self._starts):
+            capacity = self._starts[i + 1] - start
+        else:
+            capacity = len(self._tokens) - start
+        if len(tokens) > capacity:
+            raise ValueError("Sentence cannot grow in flat storage")
+        self._tokens[start:start + len(tokens)] = array("i", tokens)
+        self._lens[i] = len(tokens)
+
+        # last slot can be shrinked, so filtering stopwords right after
+        # appending does not waste space (views of a snapshot cannot shrink)
+        if i == len(self._starts) - 1 and isinstance(self._tokens, array):
+            del self._tokens[start + len(tokens):]
+
+    def set_backup(self, i, removed):
+        start = self._orig_starts[i]
+        self._removed[start:start + len(removed)] = removed
+
+    def load(self, i):
+        """ creates a temporary Sentence object, that can be modified and
+        then written back with store() """
+        sen = Sentence(self.get(i))
+        if self._backup:
+            sen.set_backup(*self.get_backup(i))
+        return sen
+
+    def store(self, i, sen):
+        self.set(i, sen.get_tokens())
+        if self._backup:
+            self.set_backup(i, sen.get_backup()[1])
+
+def _array_of(view):
+    if isinstance(view, array):
+        return view
+    result = array("i")
+    result.fromstring(buffer(view))
+    return result
+
+def _starts_of(lens):
+    starts = array("l")
+    start = 0
+    for l in lens:
+        starts.append(start)
+        start += l
+    return starts
+
+class SentenceView(object):
+    """
+    lightweight view of one sentence in FlatSentences, that behaves like a
+    Sentence
+    """
+    __slots__ = ["_store", "_i"]
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    def __len__(self):
+        return self._store._lens[self._i]
+
+    def __iter__(self):
+        return iter(self._store.get(self._i))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self._store.get(self._i))[key]
+        length = self._store._lens[self._i]
+        if key < 0:
+            key += length
+        if key < 0 or key >= length:
+            raise IndexError("token index out of range")
+        return self._store._tokens[self._store._starts[self._i] + key]
+
+    def __setitem__(self, key, value):
+        tokens = list(self._store.get(self._i))
+        tokens[key] = value
+        self._store.set(self._i, tokens)
+
+    def __delitem__(self, key):
+        tokens = list(self._store.get(self._i))
+        del tokens[key]
+        self._store.set(self._i, tokens)
+
+    def __contains__(self, item):
+        return item in self._store.get(self._i)
+
+    def __str__(self):
+        return " ".join(str(tok) for tok in self._store.get(self._i))
+
+    def ngram_positions(self, ngram):
+        return ngram_positions(self._store.get(self._i), ngram)
+
+    def remove_ngram(self, ngram, backup=False):
+        sen = self._store.load(self._i)
+        sen.remove_ngram(ngram, backup)
+        self._store.store(self._i, sen)
+
+    def remove_toks(self, toks, backup=False):
+        sen = self._store.load(self._i)
+        sen.remove_toks(toks, backup)
+        self._store.store(self._i, sen)
+
+    def get_tokens(self, backup=False):
+        if backup and self._store._backup:
+            orig, removed = self._store.get_backup(self._i)
+            return [(tok if not r else (tok,))
+                    for tok, r in zip(orig, removed)]
+        return list(self._store.get(self._i))
+
+    def get_backup(self):
+        if self._store._backup:
+            return self._store.get_backup(self._i)
+        return self._store.get(self._i), bytearray(len(self))
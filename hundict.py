@@ -1,14 +1,37 @@
-from math import log
+from collections import defaultdict
+from math import log, sqrt
 import logging
 from optparse import OptionParser
+import os
 import sys
 
 from dictionary import Dictionary
-from bicorpus import BiCorpus
+from bicorpus import BiCorpus, PARALLEL_PHASES, open_file
+from lattice import NgramPairLattice
+from lru import LRUCache
+import parallel
+from snapshot import Snapshot
+
+def _extend_seeds(shard):
+    """ extends a range of (pair, score) seeds, returns their results and
+    expansion cache statistics of the shard """
+    start, end = shard
+    db, seeds = parallel.shared()
+    cache = db._expansion_cache
+    hits, misses = cache.hits, cache.misses
+    results = [db.extend_pair_with_ngrams(pair, score)
+               for pair, score in seeds[start:end]]
+    return results, cache.hits - hits, cache.misses - misses
 
 class DictBuilder:
+    # scorers, that increase with the cooccurence count and decrease with
+    # the occurence count of the target, so hopeless unigram sets can be
+    # pruned by the score of the best possible contingency table
+    monotone_scorers = ("pmi", "wmi", "dice", "tscore")
+
     def __init__(self, bicorpus, scorer, bound_multiplier, strdiff, ngrams,
-                 sets, sparse_bound, uniset_min, uniset_max):
+                 sets, sparse_bound, uniset_min, uniset_max, batch=False,
+                 strdiff_vocab=False, expansion_cache_size=0):
         self._bicorpus = bicorpus
         self._scorer = scorer
         self._dict = Dictionary()
@@ -20,55 +43,78 @@ class DictBuilder:
         self.sparse_bound = sparse_bound
         self.uniset_min = uniset_min
         self.uniset_max = uniset_max
-
-    def filter_mutual_pairs(self, pairs):
+        self.batch = batch
+        self.strdiff_vocab = strdiff_vocab
+
+        # LRU cache of ngram pair -> scored children during one ngram
+        # extension pass, seeds of the pass share most of their expansions.
+        # It is bounded by the number of cached children
+        self.expansion_cache_size = expansion_cache_size
+        self._expansion_cache = LRUCache(expansion_cache_size)
+
+    def filter_mutual_pairs(self, pairs, tolerance=1e-7):
+        """
+        yields (pair, score) of pairs, that are the best pair of both their
+        src and tgt. A word is skipped, if it has more pairs within
+        tolerance of its best score, so the result does not depend on the
+        order of pairs
+        """
         best_src = {}
         best_tgt = {}
-        scores = {}
-        for ngram_pair in pairs:
-            score = pairs[ngram_pair]
+        for ngram_pair, score in pairs.iteritems():
             src, tgt = ngram_pair
-            scores[ngram_pair] = score
-            # if already saved, 
-            if best_src.has_key(src):
-                # save if better
-                if best_src[src][0][1] < score:
-                    best_src[src] = [(tgt, score)]
-                # store if same
-                elif abs(best_src[src][0][1] - score) < 1e-7:
-                    best_src[src].append((tgt, score))
-
-            # if not saved, save it
-            else:
-                best_src[src] = [(tgt, score)]
-
-            # same as above but with tgt tokens
-            if best_tgt.has_key(tgt):
-                if best_tgt[tgt][0][1] < score:
-                    best_tgt[tgt] = [(src, score)]
-                elif abs(best_tgt[tgt][0][1] - score) < 1e-7:
-                    best_tgt[tgt].append((src, score))
-            else:
-                best_tgt[tgt] = [(src, score)]
+            if src not in best_src or best_src[src] < score:
+                best_src[src] = score
+            if tgt not in best_tgt or best_tgt[tgt] < score:
+                best_tgt[tgt] = score
+
+        # pairs within tolerance of the best score of their words
+        near_best_src = defaultdict(list)
+        near_best_tgt = defaultdict(list)
+        for ngram_pair, score in pairs.iteritems():
+            src, tgt = ngram_pair
+            if best_src[src] - score < tolerance:
+                near_best_src[src].append(ngram_pair)
+            if best_tgt[tgt] - score < tolerance:
+                near_best_tgt[tgt].append(ngram_pair)
 
         # filter if mutual bests
-        for src in best_src.keys():
+        for src, src_pairs in near_best_src.iteritems():
             # if there are two tgts with same score, skip src
-            if len(best_src[src]) != 1:
+            if len(src_pairs) != 1:
                 continue
+            ngram_pair = src_pairs[0]
+            # if there are two srcs for tgt, skip it
+            if near_best_tgt[ngram_pair[1]] == [ngram_pair]:
+                yield (ngram_pair, pairs[ngram_pair])
 
-            try:
-                best_srcs_for_tgt = best_tgt[best_src[src][0][0]]
-                # it there are two srcs for tgt, skip it
-                if len(best_srcs_for_tgt) != 1:
-                    continue
-                
-                best_src_for_tgt = best_srcs_for_tgt[0]
-                if best_src_for_tgt[0] == src:
-                    new_ngram_pair = (src, best_src[src][0][0])
-                    yield (new_ngram_pair, scores[new_ngram_pair])
-            except KeyError, e:
-                raise e
+    @staticmethod
+    def filter_mutual_pairs_batch(src_ids, tgt_ids, scores, tolerance=1e-7):
+        """
+        column oriented version of filter_mutual_pairs() for arrays of src
+        and tgt ids (non-negative ints) and scores of pairs: best scores of
+        every src and tgt are counted by a group-by-max, and a pair is kept
+        if it is the only one within tolerance of the best score on both
+        sides. Returns the mask of kept pairs
+        a word is dropped, if it has more best pairs within tolerance of
+        its maximum, independently of the order of pairs
+        """
+        # numpy is needed only in batch mode
+        import numpy
+
+        scores = numpy.asarray(scores, dtype=numpy.float64)
+        keep = numpy.ones(len(scores), dtype=bool)
+        if len(scores) == 0:
+            return keep
+        for side_ids in (src_ids, tgt_ids):
+            side_ids = numpy.asarray(side_ids, dtype=numpy.int64)
+            best = numpy.full(side_ids.max() + 1, -numpy.inf)
+            numpy.maximum.at(best, side_ids, scores)
+            near_best = best[side_ids] - scores < tolerance
+            n_best = numpy.bincount(side_ids[near_best],
+                                    minlength=len(best))
+            keep &= near_best & (n_best[side_ids] == 1)
+        return keep
 
     def extend_pair_with_ngrams(self, orig_pair, orig_score, ratio=0.97):
         to_process = set([(orig_pair, orig_score)])
@@ -85,24 +131,10 @@ class DictBuilder:
             if actual_pair in done:
                 continue
 
-            src, tgt = actual_pair
             if actual_score / max_score < ratio:
                 continue
 
-            src_occ = self._bicorpus._src.ngram_index(src)
-            tgt_occ = self._bicorpus._tgt.ngram_index(tgt)
-            ngram_indices = src_occ & tgt_occ
-            children = self._bicorpus.ngram_pair_neighbours(actual_pair,
-                                                            ngram_indices)
-            for child in children:
-                child_pair, _, src_changed = child
-                if src_changed:
-                    table = self._bicorpus.contingency_table(child_pair,
-                        tgt_occ_s=tgt_occ)
-                else:
-                    table = self._bicorpus.contingency_table(child_pair, 
-                        src_occ_s=src_occ)
-                child_score = self.score(table)
+            for child_pair, child_score in self.expand_pair(actual_pair):
                 if child_score / max_score > ratio:
                     to_process.add((child_pair, child_score))
                 max_score = max(max_score, child_score)
@@ -115,36 +147,70 @@ class DictBuilder:
         else:
             return final[-1]
 
+    def _extend_seeds_in_parallel(self, seeds, shards_per_worker=8):
+        """ yields results of extend_pair_with_ngrams() for seeds in their
+        order, counted in a process pool """
+        for results, hits, misses in parallel.map_shards(
+                _extend_seeds, len(seeds), self._bicorpus._workers,
+                shards_per_worker, state=(self, seeds)):
+            self._expansion_cache.hits += hits
+            self._expansion_cache.misses += misses
+            for result in results:
+                yield result
+
+    def expand_pair(self, pair):
+        """ neighbouring ngram pairs of pair and their scores, they can come
+        from the expansion cache, so they must not be modified """
+        if self.expansion_cache_size > 0:
+            children = self._expansion_cache.get(pair)
+            if children is not None:
+                return children
+
+        src, tgt = pair
+        src_occ = self._bicorpus._src.ngram_index(src)
+        tgt_occ = self._bicorpus._tgt.ngram_index(tgt)
+        ngram_indices = src_occ & tgt_occ
+        children = []
+        for child_pair, _, src_changed in self._bicorpus.ngram_pair_neighbours(
+                pair, ngram_indices):
+            if src_changed:
+                table = self._bicorpus.contingency_table(child_pair,
+                    tgt_occ_s=tgt_occ)
+            else:
+                table = self._bicorpus.contingency_table(child_pair, 
+                    src_occ_s=src_occ)
+            children.append((child_pair, self.score(table)))
+
+        if self.expansion_cache_size > 0:
+            self._expansion_cache.put(pair, children)
+        return children
+
     def extend_with_ngrams(self, pairs, scale=1.0):
-        def __ngram_pair_parents(ngram_pair):
-            parents = []
-            src, tgt = ngram_pair
-            if len(src) > 1:
-                parents.append((src[1:], tgt))
-                parents += __ngram_pair_parents((src[1:], tgt))
-                parents.append((src[:-1], tgt))
-                parents += __ngram_pair_parents((src[:-1], tgt))
-            if len(tgt) > 1:
-                parents.append((src, tgt[1:]))
-                parents += __ngram_pair_parents((src, tgt[1:]))
-                parents.append((src, tgt[:-1]))
-                parents += __ngram_pair_parents((src, tgt[:-1]))
-            return parents
-        
         logging.info("Extending dictionary with ngrams started.")
         to_delete = set()
         new_pairs = {}
         orig_pairs = pairs
+        # sub-pairs of new pairs and their best scored original pair
+        lattice = NgramPairLattice(orig_pairs)
+        # seeds can delete each other, so they are extended from the best
+        # one (ties by pair), not in the order of pairs
+        seeds = sorted(orig_pairs.iteritems(), key=lambda x: (-x[1], x[0]))
+        # in parallel mode every seed is extended in advance in worker
+        # processes, and only results of not deleted seeds are used below
+        in_parallel = self._bicorpus.in_parallel("ngrams")
+        if in_parallel:
+            extended = self._extend_seeds_in_parallel(seeds)
         status = 0
-        for pair in orig_pairs.iterkeys():
+        for pair, score in seeds:
             if status * 100 / len(orig_pairs) > (status + 1) * 100 / len(orig_pairs):
                 logging.info("{0}% done".format(status * 100 / len(orig_pairs)))
             status += 1
+            better = (next(extended) if in_parallel else None)
             if pair in to_delete:
                 continue
 
-            score = orig_pairs[pair]
-            better = self.extend_pair_with_ngrams(pair, score)
+            if not in_parallel:
+                better = self.extend_pair_with_ngrams(pair, score)
             if better is None:
                 continue
             else:
@@ -158,24 +224,31 @@ class DictBuilder:
 
                 # if there is a better parent, keep that and throw new child away,
                 # if there isnt, keep new child and remove worse parents
-                is_better_parent = False
-                parents = __ngram_pair_parents(pair)
-                parents = __ngram_pair_parents(better_pair)
-                for parent in parents:
-                    if parent in orig_pairs:
-                        if orig_pairs[parent] > better_score:
-                            is_better_parent = True
-                            break
+                best_parent = lattice.best_ancestor(better_pair)
+                is_better_parent = (best_parent is not None and
+                                    best_parent[0] > better_score)
                 if not is_better_parent:
+                    parents = lattice.ancestors(better_pair)
                     new_pairs[better_pair] = better_score
-                    to_delete |= set(parents)
+                    to_delete |= parents
                     logging.debug("{0} is better than {1}".format(
                         better_pair, parents))
 
+        if in_parallel:
+            # every result is used, this shuts the pool down
+            extended.close()
+
         for p in to_delete:
             if p in orig_pairs:
                 del orig_pairs[p]
 
+        # expansions are valid only until the corpus changes
+        if self.expansion_cache_size > 0:
+            logging.info("expansion cache: {0}".format(
+                self._expansion_cache.stats()))
+            self._expansion_cache.clear()
+            self._expansion_cache.reset_stats()
+
         logging.info("Extending dictionary with ngrams finished with " +
                     "{0} new pairs.".format(len(new_pairs)))
         return dict(orig_pairs.items() + new_pairs.items())
@@ -185,21 +258,25 @@ class DictBuilder:
             score = pairs[pair]
             self._dict[pair] = score
         self._bicorpus.remove_ngram_pairs(pairs.keys())
-        self._bicorpus.build_cache()
+        self._bicorpus.update_cache()
 
     def build_low_strdiff_pairs(self):
         if not self.strdiff:
             return
 
-        good_pairs = self._bicorpus.get_low_strdiff_pairs()
+        good_pairs = self._bicorpus.get_low_strdiff_pairs(self.strdiff_vocab)
         for p in good_pairs:
             cont_table = self._bicorpus.contingency_table(p[0])
             score = self.score(cont_table)
             self._dict[p[0]] = p[1]
             logging.debug("Pair added. ({0})".format(score))
         self._bicorpus.remove_ngram_pairs([p for p in self._dict])
+        self._bicorpus.update_cache()
 
     def build_unigram_pairs(self, bound):
+        if self.batch:
+            return self.build_unigram_pairs_batch(bound)
+
         # get all possible unigram pairs
         unigram_pairs = self._bicorpus.generate_unigram_pairs()
 
@@ -220,14 +297,40 @@ class DictBuilder:
         logging.info("{0} unigram pairs found at bound {1}".format(len(res), bound))
         return res
 
+    def build_unigram_pairs_batch(self, bound):
+        """ same as build_unigram_pairs(), but with contingency tables of
+        all candidates in one array """
+        src_ids, tgt_ids, tables = self._bicorpus.unigram_contingency_tables()
+
+        # filter by sparsity
+        dense = ((tables[:, 0] + tables[:, 1] >= self.sparse_bound) &
+                 (tables[:, 0] + tables[:, 2] >= self.sparse_bound))
+
+        # count score
+        scores = self.score_batch(tables[dense])
+        good = scores >= bound
+        src_ids, tgt_ids = src_ids[dense][good], tgt_ids[dense][good]
+        scores = scores[good]
+
+        mutual = self.filter_mutual_pairs_batch(src_ids, tgt_ids, scores)
+        res = dict((((src,), (tgt,)), score) for src, tgt, score in
+                   zip(src_ids[mutual].tolist(), tgt_ids[mutual].tolist(),
+                       scores[mutual].tolist()))
+        logging.info("{0} unigram pairs found at bound {1}".format(len(res), bound))
+        return res
+
     def build_unigram_set_pairs(self, bound):
         """ function to look for pairs, that can be translation pairs only if
         one of the languages contains at least two words. Not ngrams, but
         words, and every time one of them is a translation"""
         logging.info("Searching for unigram set pairs...")
+        reachable = None
+        if self._scorer.__name__ in self.monotone_scorers and bound > 0:
+            reachable = lambda table: self.score(table) >= bound
         good_set_pairs = []
         for results in self._bicorpus.generate_unigram_set_pairs(
-                min_len=self.uniset_min, max_len=self.uniset_max):
+                min_len=self.uniset_min, max_len=self.uniset_max,
+                reachable=reachable):
             scores = []
             #collect only good scores
             for src, tgt, table in results:
@@ -253,7 +356,7 @@ class DictBuilder:
                     to_remove.append((src_, tgt_))
 
         self._bicorpus.remove_ngram_pairs(to_remove)
-        self._bicorpus.build_cache()
+        self._bicorpus.update_cache()
         logging.info("Searching for unigram set pairs done")
 
     def build_iter(self, bound):
@@ -274,22 +377,66 @@ class DictBuilder:
         if self.sets:
             self.build_unigram_set_pairs(self.set_bound_multiplier * bound)
         
-    def build(self, bound, iters):
+    def save_checkpoint(self, path, next_iter, bound):
+        """
+        saves the reduced corpus (with its cache), the dictionary and the
+        state of build() to a binary snapshot. It is written to a temporary
+        file first, so the previous checkpoint is kept if saving dies
+        """
+        state = {"dict": dict((pair, self._dict[pair]) for pair in self._dict),
+                 "next_iter": next_iter, "bound": bound}
+        tmp_path = path + ".tmp"
+        self._bicorpus.save(tmp_path, extra_blocks={"checkpoint": state})
+        os.rename(tmp_path, path)
+        logging.info("Checkpoint saved before {0}.iteration".format(next_iter))
+
+    def load_checkpoint(self, path):
+        """
+        loads the dictionary of a checkpoint saved by save_checkpoint() and
+        returns (next iteration, bound) to continue build() with. The
+        corpus of the checkpoint has to be loaded with BiCorpus.load()
+        """
+        snapshot = Snapshot(path)
+        if "checkpoint" not in snapshot:
+            snapshot.close()
+            raise ValueError("{0} is not a checkpoint".format(path))
+        state = snapshot.get("checkpoint")
+        snapshot.close()
+        for pair, score in state["dict"].iteritems():
+            self._dict[pair] = score
+        logging.info("Resuming from checkpoint before {0}.iteration".format(
+            state["next_iter"]))
+        return state["next_iter"], state["bound"]
+
+    def build(self, bound, iters, checkpoint=None, first_iter=None):
+        """
+        if checkpoint is given, state is saved there after every phase.
+        If first_iter is given (resuming from a checkpoint), low strdiff
+        phase and iterations before it are skipped
+        """
         logging.info("Building dictionary started...")
 
-        # searching for low strdiff pairs first
-        self.build_low_strdiff_pairs()
+        if first_iter is None:
+            # searching for low strdiff pairs first
+            self.build_low_strdiff_pairs()
+            first_iter = 0
+            if checkpoint is not None:
+                self.save_checkpoint(checkpoint, first_iter, bound)
 
-        for _iter in xrange(iters):
+        for _iter in xrange(first_iter, iters):
             logging.info("{0}.iteration started".format(_iter))
             self.build_iter(bound)
+            self._bicorpus.log_ngram_cache_stats()
             logging.info("iteration finished.")
             bound /= 2.0
+            if checkpoint is not None:
+                self.save_checkpoint(checkpoint, _iter + 1, bound)
 
     def score(self, cont_table):
         try:
             return self._scorer(cont_table)
-        except ZeroDivisionError:
+        except (ZeroDivisionError, ValueError):
+            # ValueError is the logarithm of zero cooccurence
             return 0.
 
     @staticmethod
@@ -309,8 +456,43 @@ class DictBuilder:
         a,b,c,d = cont_table
         return 2.0 * a / (2 * a + b + c)
 
+    @staticmethod
+    def llr(cont_table):
+        """ log-likelihood ratio, negative for negatively associated pairs """
+        a,b,c,d = cont_table
+        n = float(a+b+c+d)
+        result = 0.
+        for observed, row, col in ((a, a+b, a+c), (b, a+b, b+d),
+                                   (c, c+d, a+c), (d, c+d, b+d)):
+            expected = row * col / n
+            if observed > 0 and expected > 0:
+                result += observed * log(observed / expected)
+        return (-2 * result if a*d < b*c else 2 * result)
+
+    @staticmethod
+    def chi2(cont_table):
+        """ chi2 statistic, negative for negatively associated pairs """
+        a,b,c,d = cont_table
+        diff = a*d - b*c
+        return float(a+b+c+d) * diff * abs(diff) / ((a+b)*(c+d)*(a+c)*(b+d))
+
+    @staticmethod
+    def tscore(cont_table):
+        a,b,c,d = cont_table
+        return (a - float(a+b) * (a+c) / (a+b+c+d)) / sqrt(a)
+
+    def score_batch(self, tables):
+        """ scores an (N x 4) array of contingency tables at once """
+        # numpy is needed only in batch mode
+        import scoring
+        # vectorized scorers have the same name as the scalar ones
+        return getattr(scoring, self._scorer.__name__)(tables)
+
 def create_option_parser():
-    parser = OptionParser("usage: %prog [options] input_file bound scorer")
+    parser = OptionParser("usage: %prog [options] input_file bound scorer\n" +
+                          "scorers: pmi, wmi, dice, llr, chi2, tscore\n" +
+                          "input_file can be gzip, bzip2 or xz compressed " +
+                          "(xz needs backports.lzma)")
     parser.add_option("-d", "--dict", dest="dict", help="gold dict file")
     parser.add_option("", "--src_stopwords", dest="src_stop",
                       help="src stopwords file")
@@ -326,6 +508,10 @@ def create_option_parser():
     
     parser.add_option("", "--strdiff", dest="strdiff", action="store_true",
                       help="string difference based method at first")
+    parser.add_option("", "--strdiff_vocab", dest="strdiff_vocab",
+                      action="store_true", help="in string difference " +
+                      "phase, look for similar words in the whole target " +
+                      "vocabulary, not only among the best cooccuring ones")
     parser.add_option("", "--ngrams", dest="ngrams", action="store_true",
                       help="After founding unigram pairs, run extending " +
                      "method for looking for ngram pairs")
@@ -342,6 +528,67 @@ def create_option_parser():
     parser.add_option("", "--set_bound_multiplier", dest="bound_multiplier",
                       default=5.0, help="multiplier for the bound when in " + 
                       "set mode [default=%default]")
+    parser.add_option("", "--compact_index", dest="compact_index",
+                      action="store_true", help="store occurences in " +
+                      "sorted arrays instead of sets to save memory")
+    parser.add_option("", "--positional_index", dest="positional",
+                      action="store_true", help="keep a positional index " +
+                      "of tokens for fast ngram lookup (useful with --ngrams)")
+    parser.add_option("", "--flat", dest="flat", action="store_true",
+                      help="store all tokens of the corpus in one flat " +
+                      "buffer instead of sentence objects to save memory")
+    parser.add_option("", "--incremental", dest="incremental",
+                      action="store_true", help="keep full cooccurence " +
+                      "counts and update them after removing pairs instead " +
+                      "of rebuilding the cache in every iteration")
+    parser.add_option("", "--cache_engine", dest="cache_engine",
+                      default="python", help="method of counting " +
+                      "cooccurences: python, sparse (needs scipy), " +
+                      "parallel (see --workers) or topk (see --topk_error) " +
+                      "[default=%default]")
+    parser.add_option("", "--workers", dest="workers", default=1,
+                      help="number of worker processes of the parallel " +
+                      "cache engine and of the phases of --parallel " +
+                      "[default=%default]")
+    parser.add_option("", "--parallel", dest="parallel",
+                      default=",".join(PARALLEL_PHASES),
+                      help="comma separated phases, that use --workers " +
+                      "too, if it is more than one: read (input_file, " +
+                      "only with int tokens), search (unigram and set " +
+                      "pairs) and ngrams (extension of pairs), empty for " +
+                      "none [default=%default]")
+    parser.add_option("", "--topk_error", dest="topk_error", default=0.01,
+                      help="error bound of counts in topk cache engine, " +
+                      "relative to all cooccurences of a word, memory is " +
+                      "proportional to its inverse [default=%default]")
+    parser.add_option("", "--snapshot", dest="snapshot",
+                      help="binary snapshot of the loaded corpus. If it " +
+                      "exists, corpus is loaded from it instead of " +
+                      "input_file (stopwords of the snapshot are used), " +
+                      "if not, it is saved after reading input_file")
+    parser.add_option("", "--checkpoint", dest="checkpoint",
+                      help="binary checkpoint of the dictionary and the " +
+                      "reduced corpus, saved after the low strdiff phase " +
+                      "and after every iteration")
+    parser.add_option("", "--resume", dest="resume", action="store_true",
+                      help="continue from the last completed phase saved " +
+                      "in --checkpoint, if it exists (input_file, " +
+                      "stopwords and gold dict are not used then)")
+    parser.add_option("", "--ngram_cache", dest="ngram_cache", default=0,
+                      help="size of an LRU cache of ngram occurence sets " +
+                      "per language: number of cached occurences plus " +
+                      "one per ngram, 0 turns it off [default=%default]")
+    parser.add_option("", "--expansion_cache", dest="expansion_cache",
+                      default=0, help="size of an LRU cache of ngram " +
+                      "pair expansions during ngram extension: number of " +
+                      "cached neighbour pairs plus one per expanded pair, " +
+                      "0 turns it off [default=%default]")
+    parser.add_option("", "--batch", dest="batch", action="store_true",
+                      help="count and score unigram candidates in " +
+                      "vectorized batches (needs numpy)")
+    parser.add_option("", "--bitsets", dest="bitsets", action="store_true",
+                      help="use compressed bitsets of occurences of frequent " +
+                      "tokens in unigram set pair mode")
     
     return parser
 
@@ -384,31 +631,90 @@ def parse_options(parser):
     sparse_bound = int(options.sparse_bound)
     uniset_min = int(options.uniset_min)
     uniset_max = int(options.uniset_max)
+    compact_index = options.compact_index
+    positional = options.positional
+    flat = options.flat
+    incremental = options.incremental
+    cache_engine = options.cache_engine
+    if cache_engine not in ("python", "sparse", "parallel", "topk"):
+        print "Not a cache engine."
+        sys.exit(-1)
+    workers = int(options.workers)
+    parallel_phases = [phase for phase in options.parallel.split(",") if phase]
+    if not set(parallel_phases) <= set(PARALLEL_PHASES):
+        print "Not a parallel phase."
+        sys.exit(-1)
+    topk_error = float(options.topk_error)
+    snapshot = options.snapshot
+    ngram_cache_size = int(options.ngram_cache)
+    batch = options.batch
+    bitsets = options.bitsets
+    strdiff_vocab = options.strdiff_vocab
+    expansion_cache_size = int(options.expansion_cache)
+    checkpoint = options.checkpoint
+    resume = options.resume
+    if resume and checkpoint is None:
+        print "--resume needs --checkpoint."
+        sys.exit(-1)
 
     return (input_file, bound, scorer, iters, src_stopwords, tgt_stopwords,
             gold, rem, bound_multiplier, strdiff, ngrams, sets, sparse_bound,
-            uniset_min, uniset_max)
+            uniset_min, uniset_max, compact_index, positional, flat,
+            incremental, cache_engine, workers, parallel_phases, topk_error,
+            snapshot, ngram_cache_size, batch, bitsets, strdiff_vocab,
+            expansion_cache_size, checkpoint, resume)
 
 def main():
     optparser = create_option_parser()
     (input_file, bound, _scorer, iters, srcstop, tgtstop, gold, rem,
      bound_multiplier, strdiff, ngrams, sets, sparse_bound, uniset_min,
-     uniset_max) = parse_options(optparser)
+     uniset_max, compact_index, positional, flat, incremental,
+     cache_engine, workers, parallel_phases, topk_error, snapshot,
+     ngram_cache_size, batch, bitsets, strdiff_vocab,
+     expansion_cache_size, checkpoint, resume) = parse_options(optparser)
     scorer = getattr(DictBuilder, _scorer)
 
     backup = rem is not None
 
-    bc = BiCorpus(backup=backup, int_tokens=True)
+    corpus_options = dict(backup=backup, compact_index=compact_index,
+                          positional=positional, flat=flat,
+                          incremental=incremental, cache_engine=cache_engine,
+                          workers=workers, parallel=parallel_phases,
+                          topk_error=topk_error,
+                          ngram_cache_size=ngram_cache_size,
+                          bitsets=bitsets)
+    resume = resume and os.path.exists(checkpoint)
+    if resume:
+        # checkpoint has the corpus after the last completed phase
+        bc = BiCorpus.load(checkpoint, **corpus_options)
+    elif snapshot is not None and os.path.exists(snapshot):
+        bc = BiCorpus.load(snapshot, **corpus_options)
+    else:
+        bc = BiCorpus(int_tokens=True, **corpus_options)
+
+        bc.set_stopwords(srcstop, tgtstop)
 
-    bc.set_stopwords(srcstop, tgtstop)
-
-    bc.read_from_file(file(input_file))
-
-    bc.remove_ngram_pairs(gold)
-
-    db = DictBuilder(bc, scorer, bound_multiplier, strdiff, ngrams, sets, sparse_bound, uniset_min, uniset_max)
-    
-    db.build(bound, iters=iters)
+        try:
+            input_f = open_file(input_file)
+        except IOError as e:
+            print e
+            sys.exit(-1)
+        bc.read_from_file(input_f)
+
+        if snapshot is not None:
+            bc.save(snapshot)
+
+    if not resume and len(gold) > 0:
+        bc.remove_ngram_pairs(gold)
+        # iterations have to see the counts of the reduced corpus
+        bc.update_cache()
+
+    db = DictBuilder(bc, scorer, bound_multiplier, strdiff, ngrams, sets, sparse_bound, uniset_min, uniset_max, batch, strdiff_vocab, expansion_cache_size)
+
+    first_iter = None
+    if resume:
+        first_iter, bound = db.load_checkpoint(checkpoint)
+    db.build(bound, iters=iters, checkpoint=checkpoint, first_iter=first_iter)
     for p in db._dict:
         if len(p) == 2:
             src, tgt = p
@@ -0,0 +1,52 @@
+class NgramPairLattice(object):
+    """
+    lattice of ngram pairs, where parents of a pair are the pairs made by
+    dropping the first or the last token of one of its ngrams, and
+    ancestors are all of its sub-pairs. scores is a dict of known pairs
+    (that can be ancestors) and their scores
+    every result is memoized, so common sub-pairs of pairs are enumerated
+    only once
+    """
+    def __init__(self, scores):
+        self._scores = scores
+        self._parents = {}
+        self._ancestors = {}
+        self._best = {}
+
+    def parents(self, pair):
+        if pair not in self._parents:
+            src, tgt = pair
+            parents = set()
+            if len(src) > 1:
+                parents.add((src[1:], tgt))
+                parents.add((src[:-1], tgt))
+            if len(tgt) > 1:
+                parents.add((src, tgt[1:]))
+                parents.add((src, tgt[:-1]))
+            self._parents[pair] = parents
+        return self._parents[pair]
+
+    def ancestors(self, pair):
+        """ every sub-pair of pair (without pair itself) """
+        if pair not in self._ancestors:
+            ancestors = set()
+            for parent in self.parents(pair):
+                ancestors.add(parent)
+                ancestors |= self.ancestors(parent)
+            self._ancestors[pair] = frozenset(ancestors)
+        return self._ancestors[pair]
+
+    def best_ancestor(self, pair):
+        """ (score, ancestor) of the best scored known ancestor, or None """
+        if pair not in self._best:
+            best = None
+            for parent in self.parents(pair):
+                candidates = [self.best_ancestor(parent)]
+                if parent in self._scores:
+                    candidates.append((self._scores[parent], parent))
+                for candidate in candidates:
+                    if candidate is not None and (best is None or
+                                                  candidate[0] > best[0]):
+                        best = candidate
+            self._best[pair] = best
+        return self._best[pair]
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    least recently used cache with hit statistics
+    it is bounded by the total size of the cached values, not by their
+    number, because a value can be a few items or a large part of the
+    corpus (occurences of a frequent ngram). The size of a value is
+    1 + len(value), so empty values count too, and a value larger than the
+    whole cache is not cached
+    """
+    __slots__ = ["_max_size", "_size", "_values", "hits", "misses"]
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        self._values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key):
+        """ cached value of key or None, it must not be modified """
+        values = self._values
+        if key not in values:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # move to the end as the most recently used
+        value = values.pop(key)
+        values[key] = value
+        return value
+
+    def put(self, key, value):
+        """ caches value of a missing key, returns the evicted keys """
+        size = 1 + len(value)
+        if size > self._max_size:
+            return []
+        self._values[key] = value
+        self._size += size
+        evicted = []
+        while self._size > self._max_size:
+            old_key, old_value = self._values.popitem(last=False)
+            self._size -= 1 + len(old_value)
+            evicted.append(old_key)
+        return evicted
+
+    def discard(self, key):
+        if key in self._values:
+            self._size -= 1 + len(self._values.pop(key))
+
+    def clear(self):
+        self._values.clear()
+        self._size = 0
+
+    def reset_stats(self):
+        self.hits, self.misses = 0, 0
+
+    def stats(self):
+        return "{0} hits, {1} misses ({2:.1%} hit rate), {3} cached " \
+            "values of size {4}".format(self.hits, self.misses,
+            float(self.hits) / max(1, self.hits + self.misses), len(self),
+            self._size)
@@ -0,0 +1,46 @@
+"""
+process pool helper for the parallel phases (--workers): the items of a
+phase are split into consecutive shards, and every shard is counted by a
+worker process. Workers get the state of the phase by forking instead of
+pickling, so it can be a whole corpus, and it can contain closures
+"""
+
+from multiprocessing import Pool
+
+# state of the running map_shards(), it is set before the pool is created
+_shared = None
+
+def shared():
+    """ state of the running map_shards(), for the function of workers """
+    return _shared
+
+def shard_bounds(n, n_shards):
+    """ (start, end) of at most n_shards consecutive non-empty ranges,
+    that cover range(n) """
+    bounds = [n * i / n_shards for i in xrange(n_shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in xrange(n_shards)
+            if bounds[i] < bounds[i + 1]]
+
+def map_shards(func, n, workers, shards_per_worker=4, state=None,
+               ordered=True):
+    """
+    splits range(n) into workers * shards_per_worker shards, and yields
+    func((start, end)) of every shard counted in a pool of workers
+    processes. func has to be a module level function, it can get state
+    by shared(). Results are yielded in the order of shards, or as they
+    are done, if not ordered
+    the pool is shut down, when the generator is exhausted or closed
+    """
+    global _shared
+    shards = shard_bounds(n, max(1, workers * shards_per_worker))
+    _shared = state
+    pool = Pool(workers)
+    try:
+        results = (pool.imap(func, shards) if ordered
+                   else pool.imap_unordered(func, shards))
+        for result in results:
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+        _shared = None
@@ -0,0 +1,209 @@
+from array import array
+from bisect import bisect_left
+from itertools import compress
+from operator import ne
+
+class PostingList(object):
+    """
+    sorted array of sentence indices, that can be used instead of a set
+    in Corpus._index
+    it keeps 4 bytes per occurence instead of a hash entry and a boxed int,
+    and supports the set operations that are used on occurence sets
+    (&, |, -, len, in, add), so calling code does not have to know about it
+    """
+    __slots__ = ["_items"]
+    typecode = "i"
+
+    def __init__(self, items=None, typecode=None):
+        # items have to be sorted and unique
+        if (isinstance(items, array) and
+            (typecode is None or items.typecode == typecode)):
+            self._items = items
+            return
+        if typecode is None:
+            typecode = self.typecode
+        if items is None:
+            self._items = array(typecode)
+        else:
+            self._items = array(typecode, items)
+
+    @classmethod
+    def from_iterable(cls, it, typecode=None):
+        if isinstance(it, PostingList):
+            return it
+        items = sorted(it)
+        if not isinstance(it, (set, frozenset)):
+            items = _unique_sorted(items)
+        return cls(items, typecode)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __nonzero__(self):
+        return len(self._items) > 0
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item):
+        items = self._items
+        i = bisect_left(items, item)
+        return i < len(items) and items[i] == item
+
+    def __repr__(self):
+        return "PostingList({0})".format(list(self._items))
+
+    def copy(self):
+        return self.__class__(array(self._items.typecode, self._items))
+
+    def add(self, item):
+        items = self._items
+        # most of the time indices come in increasing order
+        if len(items) == 0 or items[-1] < item:
+            items.append(item)
+            return
+        i = bisect_left(items, item)
+        if items[i] != item:
+            items.insert(i, item)
+
+    def discard(self, item):
+        items = self._items
+        i = bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.discard(item)
+
+    def __and__(self, other):
+        other = PostingList.from_iterable(other, self._items.typecode)
+        return self.__class__(intersect(self._items, other._items))
+    __rand__ = __and__
+
+    def __or__(self, other):
+        other = PostingList.from_iterable(other, self._items.typecode)
+        return self.__class__(union(self._items, other._items))
+    __ror__ = __or__
+
+    def __sub__(self, other):
+        other = PostingList.from_iterable(other, self._items.typecode)
+        return self.__class__(difference(self._items, other._items))
+
+    def __rsub__(self, other):
+        other = PostingList.from_iterable(other, self._items.typecode)
+        return self.__class__(difference(other._items, self._items))
+
+    def followed_by(self, other, shift):
+        """
+        returns items x, for which x + shift is in other
+        used for merging position lists of consecutive ngram tokens
+        """
+        return self.__class__(intersect_shifted(self._items, other._items,
+                                                shift))
+
+class PositionList(PostingList):
+    """
+    sorted array of encoded (sentence, offset) positions, see
+    encode_position()
+    """
+    __slots__ = []
+    typecode = "l"
+
+POS_BITS = 20
+POS_MASK = (1 << POS_BITS) - 1
+
+def encode_position(sen_i, offset):
+    if offset > POS_MASK:
+        raise ValueError("Sentence is too long for positional index")
+    return (sen_i << POS_BITS) | offset
+
+def decode_position(pos):
+    return pos >> POS_BITS, pos & POS_MASK
+
+def intersect(a, b):
+    """
+    galloping intersection of two sorted arrays: every item of the shorter
+    one is searched in the longer one, starting from the last hit
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    result = array(a.typecode)
+    lo = 0
+    n = len(b)
+    for item in a:
+        lo = bisect_left(b, item, lo)
+        if lo == n:
+            break
+        if b[lo] == item:
+            result.append(item)
+            lo += 1
+    return result
+
+def intersect_shifted(a, b, shift):
+    result = array(a.typecode)
+    if len(a) <= len(b):
+        lo = 0
+        n = len(b)
+        for item in a:
+            lo = bisect_left(b, item + shift, lo)
+            if lo == n:
+                break
+            if b[lo] == item + shift:
+                result.append(item)
+                lo += 1
+    else:
+        lo = 0
+        n = len(a)
+        for item in b:
+            lo = bisect_left(a, item - shift, lo)
+            if lo == n:
+                break
+            if a[lo] == item - shift:
+                result.append(item - shift)
+                lo += 1
+    return result
+
+def difference(a, b):
+    result = array(a.typecode)
+    lo = 0
+    n = len(b)
+    for item in a:
+        if lo < n:
+            lo = bisect_left(b, item, lo)
+            if lo < n and b[lo] == item:
+                continue
+        result.append(item)
+    return result
+
+def _unique_sorted(items):
+    """ sorted list without its duplicates, they are next to each other """
+    rest = items[1:]
+    return items[:1] + list(compress(rest, map(ne, rest, items)))
+
+def union(a, b):
+    """
+    merge of two sorted arrays without duplicates
+    if one is much shorter, its items are searched in the longer one,
+    starting from the last hit, and the runs of the longer one between them
+    are copied at once. Else the concatenation is sorted, that merges its
+    two sorted runs in linear time, and duplicates are dropped, so there is
+    no python loop over the items
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) * 8 >= len(b):
+        result = array(b.typecode)
+        result.fromlist(_unique_sorted(sorted(a + b)))
+        return result
+    result = array(b.typecode)
+    lo = 0
+    n = len(b)
+    for item in a:
+        hi = bisect_left(b, item, lo)
+        result.extend(b[lo:hi])
+        result.append(item)
+        lo = (hi + 1 if hi < n and b[hi] == item else hi)
+    result.extend(b[lo:])
+    return result
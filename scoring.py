@@ -0,0 +1,75 @@
+"""
+vectorized versions of DictBuilder scorers
+every function gets an (N x 4) array of contingency tables
+(coocc, only_src, only_tgt, others) and returns N scores. Where a score
+cannot be counted (zero division or zero cooccurence in a logarithm), it
+is 0, like DictBuilder.score() does
+"""
+
+import numpy
+
+def _columns(tables):
+    tables = numpy.asarray(tables, dtype=numpy.float64).reshape(-1, 4)
+    return tables[:, 0], tables[:, 1], tables[:, 2], tables[:, 3]
+
+def _safe_divide(num, den):
+    result = numpy.zeros(numpy.broadcast(num, den).shape)
+    good = den != 0
+    numpy.divide(num, den, out=result, where=good)
+    return result, good
+
+def _log2_ratio(a, b, c, d):
+    """ log2(a * n / ((a + b) * (a + c))) and where it is valid """
+    n = a + b + c + d
+    ratio, good = _safe_divide(a * n, (a + b) * (a + c))
+    good &= ratio > 0
+    result = numpy.zeros(len(a))
+    # log(x) / log(2) like math.log(x, 2), to get the same scores as the
+    # scalar scorers
+    result[good] = numpy.log(ratio[good]) / numpy.log(2)
+    return result, good
+
+def pmi(tables, weighted=False):
+    a, b, c, d = _columns(tables)
+    n = a + b + c + d
+    log_ratio, good = _log2_ratio(a, b, c, d)
+    weight, good_weight = _safe_divide((a if weighted else 1.), n)
+    return numpy.where(good & good_weight, weight * log_ratio, 0.)
+
+def wmi(tables):
+    return pmi(tables, True)
+
+def dice(tables):
+    a, b, c, d = _columns(tables)
+    return _safe_divide(2.0 * a, 2 * a + b + c)[0]
+
+def llr(tables):
+    """ log-likelihood ratio (G2) of the table, negative for negatively
+    associated pairs """
+    a, b, c, d = _columns(tables)
+    n = a + b + c + d
+    rows = (a + b, c + d)
+    cols = (a + c, b + d)
+    result = numpy.zeros(len(a))
+    for observed, row, col in ((a, rows[0], cols[0]), (b, rows[0], cols[1]),
+                               (c, rows[1], cols[0]), (d, rows[1], cols[1])):
+        expected, good = _safe_divide(row * col, n)
+        # 0 * log(0) terms are 0
+        good &= (observed > 0) & (expected > 0)
+        result[good] += observed[good] * numpy.log(observed[good] /
+                                                   expected[good])
+    return numpy.where(a * d < b * c, -2 * result, 2 * result)
+
+def chi2(tables):
+    """ negative for negatively associated pairs """
+    a, b, c, d = _columns(tables)
+    n = a + b + c + d
+    diff = a * d - b * c
+    return _safe_divide(n * diff * numpy.abs(diff),
+                        (a + b) * (c + d) * (a + c) * (b + d))[0]
+
+def tscore(tables):
+    a, b, c, d = _columns(tables)
+    n = a + b + c + d
+    expected = _safe_divide((a + b) * (a + c), n)[0]
+    return _safe_divide(a - expected, numpy.sqrt(a))[0]
@@ -1,6 +1,37 @@
-class Sentence:
+from array import array
+from itertools import compress
+
+# swaps 0 and 1 bytes of a mask
+_INVERT = "".join(chr(c) for c in xrange(256)).replace("\0\1", "\1\0", 1)
+
+def ngram_positions(tokens, ngram):
+    """ start offsets of ngram occurences in tokens """
+    n = len(ngram)
+    first = ngram[0]
+    if n == 1:
+        return [i for i, tok in enumerate(tokens) if tok == first]
+
+    result = []
+    for i in xrange(len(tokens) - n + 1):
+        if tokens[i] != first:
+            continue
+        for k in xrange(1, n):
+            if tokens[i + k] != ngram[k]:
+                break
+        else:
+            result.append(i)
+    return result
+
+class Sentence(object):
+    # there are millions of sentences, so they have no __dict__
+    # backup fields are None until backup is needed
+    __slots__ = ["_sen", "_orig", "_removed", "_live"]
+
     def __init__(self, tokens):
         self._sen = list(tokens)
+        self._orig = None
+        self._removed = None
+        self._live = None
 
     def __len__(self):
         return len(self._sen)
@@ -19,70 +50,76 @@ class Sentence:
 
     def __contains__(self, item):
         return item in self._sen
-    
+
     def __str__(self):
         return " ".join(self._sen)
 
     def ngram_positions(self, ngram):
-        result = []
-
-        for starter_index in (i for i, tok in enumerate(self._sen) if tok == ngram[0]):
-            good = True
-            for tok_i, tok in enumerate(ngram[1:]):
-                try:
-                    # search for remaining tokens
-                    if self[starter_index + 1 + tok_i] == tok:
-                        pass
-                    else:
-                        good = False
-                        break
-                except IndexError:
-                    good = False
-                    break
-            if good:
-                result.append(starter_index)
-        return result
+        return ngram_positions(self._sen, ngram)
 
     def init_backup(self):
-        if not "_backup_sen" in self.__dict__:
-            self._backup_sen = list(self._sen)
+        # backup is the original sentence with a mask of removed tokens, and
+        # the original offset of every live token
+        if self._orig is None:
+            self._orig = list(self._sen)
+            self._removed = bytearray(len(self._sen))
+            self._live = array("i", xrange(len(self._sen)))
+
+    def set_backup(self, orig, removed):
+        """ sets the original sentence and its mask of removed tokens, not
+        removed ones has to be the current tokens """
+        self._orig = list(orig)
+        self._removed = bytearray(removed)
+        self._live = array("i", compress(xrange(len(self._removed)),
+                                         self._removed.translate(_INVERT)))
+
+    def get_backup(self):
+        """ returns the original sentence and its mask of removed tokens """
+        self.init_backup()
+        return self._orig, self._removed
 
     def remove_ngram(self, ngram, backup=False):
         positions = self.ngram_positions(ngram)
         if backup:
             self.init_backup()
-            # look for position in backup sentence
-            backup_positions = []
-            for pos in positions:
-                backup_pos = 0
-                for i, tok in enumerate(self._backup_sen):
-                    if type(tok) == tuple:
-                        continue
-                    else:
-                        if backup_pos == pos:
-                            backup_positions.append(i)
-                            break
-                        backup_pos += 1
-         
+        backup = self._orig is not None
+
         for i, pos in enumerate(positions):
-            if backup:
-                for ngram_pos in xrange(len(ngram)):
-                    self._backup_sen[backup_positions[i]+ngram_pos] = (self._backup_sen[backup_positions[i]+ngram_pos],)
             shift = i * len(ngram)
-            del self._sen[pos-shift:pos-shift+len(ngram)]
+            start, end = pos - shift, pos - shift + len(ngram)
+            if backup:
+                for orig_i in self._live[start:end]:
+                    self._removed[orig_i] = 1
+                del self._live[start:end]
+            del self._sen[start:end]
 
     def remove_toks(self, toks, backup=False):
         if backup:
             self.init_backup()
-            for i, tok in enumerate(self._sen):
-                if tok in toks:
-                    self._backup_sen[i] = (tok,)
-        self._sen = filter(lambda x: x not in toks, self._sen)
+        sen = self._sen
+        if self._orig is None:
+            # filtered in place, the list is kept
+            sen[:] = [tok for tok in sen if tok not in toks]
+            return
+
+        live, removed = self._live, self._removed
+        j = 0
+        for i in xrange(len(sen)):
+            tok = sen[i]
+            if tok in toks:
+                removed[live[i]] = 1
+            else:
+                sen[j] = tok
+                live[j] = live[i]
+                j += 1
+        del sen[j:]
+        del live[j:]
 
     def get_tokens(self, backup=False):
         if backup:
+            # removed tokens are in 1-tuples
             self.init_backup()
-            return self._backup_sen
+            return [(tok if not r else (tok,))
+                    for tok, r in zip(self._orig, self._removed)]
         else:
             return self._sen
-    
@@ -0,0 +1,98 @@
+"""
+binary snapshot files of a loaded BiCorpus
+
+layout:
+    magic, header length (8 bytes, little endian), header, data
+header is a marshalled (meta, table) pair, where meta is a dict of
+settings and vocabularies, and table lists the data blocks as
+(name, typecode, offset, length in bytes). Blocks with an array typecode
+are raw arrays (token ids, sentence lengths, posting lists), blocks with
+None typecode are marshalled python objects (caches)
+
+on load the file is memory-mapped and blocks are read only when they are
+asked for. Array blocks can also be viewed in place as ctypes arrays, the
+mapping is copy on write, so views can be modified without touching the
+file
+"""
+
+from array import array
+import ctypes
+import marshal
+import mmap
+import struct
+
+MAGIC = "HUNDICT\x01"
+
+_CTYPES = {"b": ctypes.c_byte, "B": ctypes.c_ubyte, "h": ctypes.c_short,
+           "H": ctypes.c_ushort, "i": ctypes.c_int, "I": ctypes.c_uint,
+           "l": ctypes.c_long, "L": ctypes.c_ulong, "f": ctypes.c_float,
+           "d": ctypes.c_double}
+
+def write_snapshot(f, meta, blocks):
+    table = []
+    offset = 0
+    marshalled = {}
+    for name in sorted(blocks):
+        data = blocks[name]
+        if isinstance(data, array):
+            typecode, length = data.typecode, len(data) * data.itemsize
+        else:
+            marshalled[name] = marshal.dumps(data)
+            typecode, length = None, len(marshalled[name])
+        table.append((name, typecode, offset, length))
+        offset += length
+
+    header = marshal.dumps((meta, table))
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", len(header)))
+    f.write(header)
+    for name, typecode, _, _ in table:
+        if typecode is None:
+            f.write(marshalled[name])
+        else:
+            blocks[name].tofile(f)
+
+class Snapshot(object):
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._viewed = False
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a hundict snapshot".format(path))
+        header_start = len(MAGIC) + 8
+        header_len = struct.unpack("<Q", self._mm[len(MAGIC):header_start])[0]
+        self.meta, table = marshal.loads(
+            self._mm[header_start:header_start + header_len])
+        self._data_start = header_start + header_len
+        self._blocks = dict((name, (typecode, offset, length))
+                            for name, typecode, offset, length in table)
+
+    def __contains__(self, name):
+        return name in self._blocks
+
+    def get(self, name):
+        typecode, offset, length = self._blocks[name]
+        start = self._data_start + offset
+        data = self._mm[start:start + length]
+        if typecode is None:
+            return marshal.loads(data)
+        result = array(typecode)
+        result.fromstring(data)
+        return result
+
+    def view(self, name):
+        """ array block as a ctypes array over the mapping, without copying
+        it. Slices of it are lists, and it cannot grow or shrink """
+        typecode, offset, length = self._blocks[name]
+        item_type = _CTYPES[typecode]
+        self._viewed = True
+        return (item_type * (length / ctypes.sizeof(item_type))).from_buffer(
+            self._mm, self._data_start + offset)
+
+    def close(self):
+        # views keep the mapping alive, it is unmapped when the last of them
+        # is freed
+        if not self._viewed:
+            self._mm.close()
+        self._mm = None
+        self._file.close()
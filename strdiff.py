@@ -0,0 +1,89 @@
+"""
+string difference tools for the low strdiff phase: a bounded levenshtein
+distance and a deletion neighbourhood index (as in SymSpell), that finds
+every word of a vocabulary within a small distance of a query word
+"""
+
+from collections import defaultdict
+
+def bounded_levenshtein(a, b, k):
+    """
+    levenshtein distance of a and b if it is at most k, k + 1 otherwise
+    only a band of width 2k + 1 of the table is counted, and counting stops
+    as soon as every cell of a row is above k
+    """
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = k + 1
+    prev = [min(j, too_far) for j in xrange(len(b) + 1)]
+    for i in xrange(1, len(a) + 1):
+        ca = a[i - 1]
+        cur = [too_far] * (len(b) + 1)
+        if i <= k:
+            cur[0] = i
+        lo, hi = max(1, i - k), min(len(b), i + k)
+        row_min = cur[0]
+        for j in xrange(lo, hi + 1):
+            d = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            if d > too_far:
+                d = too_far
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > k:
+            return too_far
+        prev = cur
+    return prev[len(b)]
+
+def deletions(word, n):
+    """ every string, that can be made from word by deleting at most n
+    characters (word itself too) """
+    result = set([word])
+    level = result
+    for _ in xrange(n):
+        next_level = set()
+        for w in level:
+            for i in xrange(len(w)):
+                next_level.add(w[:i] + w[i + 1:])
+        result |= next_level
+        level = next_level
+    return result
+
+class DeletionIndex(object):
+    """
+    index of words by their deletion neighbourhoods. If two words are
+    within max_dist levenshtein distance, they have a common string with at
+    most max_dist deletions from both, so candidates() returns a superset
+    of close words, that search() checks by bounded_levenshtein()
+    """
+    def __init__(self, max_dist=2):
+        self._max_dist = max_dist
+        self._index = defaultdict(list)
+
+    def add(self, word, item):
+        for variant in deletions(word, self._max_dist):
+            self._index[variant].append((item, word))
+
+    def candidates(self, word):
+        """ (item, word) pairs, that can be close to word """
+        result = set()
+        index = self._index
+        for variant in deletions(word, self._max_dist):
+            if variant in index:
+                result.update(index[variant])
+        return result
+
+    def search(self, word, max_dist=None):
+        """ yields (item, distance) of words within max_dist """
+        if max_dist is None:
+            max_dist = self._max_dist
+        for item, other in self.candidates(word):
+            dist = bounded_levenshtein(word, other, max_dist)
+            if dist <= max_dist:
+                yield item, dist
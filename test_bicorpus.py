@@ -0,0 +1,135 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from bicorpus import BiCorpus
+
+def random_bicorpus(n=500, seed=0, **kwargs):
+    """ small corpus of random sentence pairs with a lot of ties in
+    cooccurence counts """
+    rnd = random.Random(seed)
+    bc = BiCorpus(**kwargs)
+    for _ in xrange(n):
+        src = [rnd.choice("abcdefghijklmnopqrst") for _ in xrange(rnd.randint(1, 6))]
+        tgt = [rnd.choice("ABCDEFGHIJKLMNOPQRST") + "x"
+               for _ in xrange(rnd.randint(1, 6))]
+        bc.add_sentence_pair((src, tgt))
+    return bc
+
+def top_list(counts, max_per_word):
+    return dict(sorted(counts.iteritems(),
+                       key=lambda x: (-x[1], x[0]))[:max_per_word])
+
+class InterestingTest(unittest.TestCase):
+    def check_top_lists(self, bc, max_per_word=3):
+        bc._incremental = True
+        bc.build_cache(max_per_word)
+        columns = {}
+        for src_tok, row in bc._coocc_cache.iteritems():
+            self.assertEqual(bc.interesting[0][src_tok],
+                             top_list(row, max_per_word))
+            for tgt_tok, count in row.iteritems():
+                columns.setdefault(tgt_tok, {})[src_tok] = count
+        self.assertEqual(len(bc.interesting[1]), len(columns))
+        for tgt_tok, column in columns.iteritems():
+            self.assertEqual(bc.interesting[1][tgt_tok],
+                             top_list(column, max_per_word))
+
+    def test_string_tokens(self):
+        self.check_top_lists(random_bicorpus(int_tokens=False))
+
+    def test_int_tokens(self):
+        self.check_top_lists(random_bicorpus(int_tokens=True))
+
+class BitsetSearchTest(unittest.TestCase):
+    def search(self, bitsets, min_occ=None):
+        bc = random_bicorpus(int_tokens=True, bitsets=bitsets)
+        if min_occ is not None:
+            bc.bitset_min_occ = min_occ
+        bc.build_cache()
+        return list(bc.generate_unigram_set_pairs(min_coocc=2, max_len=3))
+
+    def test_same_as_sets(self):
+        # tokens occur about 90 times, so thresholds between mix the two
+        expected = self.search(False)
+        for min_occ in [None, 0, 90, 1000]:
+            self.assertEqual(self.search(True, min_occ), expected)
+
+class IncrementalCacheTest(unittest.TestCase):
+    def removed_pairs(self, bc, n, seed):
+        rnd = random.Random(seed)
+        src_toks = sorted(bc._src._tokmap.values())
+        tgt_toks = sorted(bc._tgt._tokmap.values())
+        return [((rnd.choice(src_toks),), (rnd.choice(tgt_toks),))
+                for _ in xrange(n)]
+
+    def check_removal(self, n, rebuild_ratio):
+        rebuilt = random_bicorpus(int_tokens=True)
+        rebuilt.build_cache()
+        incremental = random_bicorpus(int_tokens=True, incremental=True)
+        incremental.incremental_rebuild_ratio = rebuild_ratio
+        incremental.build_cache()
+        for seed in xrange(3):
+            pairs = self.removed_pairs(rebuilt, n, seed)
+            rebuilt.remove_ngram_pairs(pairs)
+            rebuilt.update_cache()
+            incremental.remove_ngram_pairs(pairs)
+            incremental.update_cache()
+            self.assertEqual(incremental.interesting[0], rebuilt.interesting[0])
+            self.assertEqual(incremental.interesting[1], rebuilt.interesting[1])
+
+    def test_delta_update(self):
+        self.check_removal(3, 1.0)
+
+    def test_fallback_to_rebuild(self):
+        self.check_removal(3, 0.0)
+
+class ParallelReadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmp, "corpus.txt")
+        rnd = random.Random(0)
+        f = open(self.corpus, "w")
+        for _ in xrange(300):
+            src = [rnd.choice("abcdefghij") for _ in xrange(rnd.randint(0, 6))]
+            tgt = [rnd.choice("ABCDEFGHIJ") for _ in xrange(rnd.randint(0, 6))]
+            f.write("{0}\t{1}\n".format(" ".join(src), " ".join(tgt)))
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, **kwargs):
+        bc = BiCorpus(int_tokens=True, **kwargs)
+        bc.set_stopwords(set(["a", "b"]), set(["A"]))
+        bc.read_from_file(open(self.corpus), chunk_lines=7)
+        return bc
+
+    def state(self, bc):
+        sides = []
+        for corpus in (bc._src, bc._tgt):
+            sides.append((corpus._tokmap,
+                          [sen.get_tokens(backup=True) for sen in corpus],
+                          [list(sen) for sen in corpus],
+                          dict((tok, sorted(occ))
+                               for tok, occ in corpus._index.iteritems())))
+        return sides
+
+    def check(self, **kwargs):
+        serial = self.read(**kwargs)
+        parallel = self.read(workers=2, **kwargs)
+        self.assertEqual(self.state(parallel), self.state(serial))
+
+    def test_same_as_serial(self):
+        self.check()
+
+    def test_backup(self):
+        self.check(backup=True)
+
+    def test_flat_backup(self):
+        self.check(backup=True, flat=True)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import random
+import unittest
+
+from bitset import Bitset
+
+class BitsetTest(unittest.TestCase):
+    def test_iteration(self):
+        rnd = random.Random(0)
+        for _ in xrange(500):
+            size = rnd.choice([10, 1000, 300000])
+            indices = set(rnd.randrange(size)
+                          for _ in xrange(rnd.randint(0, 50)))
+            bitset = Bitset.from_indices(indices)
+            self.assertEqual(list(bitset), sorted(indices))
+            self.assertEqual(len(bitset), len(indices))
+
+    def test_iteration_of_sparse_chunks(self):
+        # members at the top of chunks, one bit at a time would be slow
+        indices = [(chunk << 16) + 65535 for chunk in xrange(1000)]
+        self.assertEqual(list(Bitset.from_indices(indices)), indices)
+
+    def test_len_of_dense_chunks(self):
+        # chunks of more than 62 bits are longs, they are counted by bytes
+        rnd = random.Random(0)
+        for size in [63, 64, 65, 1000, 65536, 200000]:
+            indices = set(rnd.sample(xrange(size), size * 3 / 4))
+            indices.add(size - 1)
+            bitset = Bitset.from_indices(indices)
+            self.assertEqual(len(bitset), len(indices))
+            self.assertEqual(bitset.intersection_len(
+                Bitset.from_indices(xrange(0, size, 2))),
+                len([i for i in indices if i % 2 == 0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+from itertools import product
+import random
+import unittest
+
+from corpus import Corpus
+
+def random_corpus(n=300, seed=0, alphabet="abcd", max_len=12, **kwargs):
+    """ corpus of a few tokens, so ngrams repeat and overlap in sentences """
+    rnd = random.Random(seed)
+    corpus = Corpus(kwargs.pop("backup", False), int_tokens=True, **kwargs)
+    for _ in xrange(n):
+        corpus.add_sentence([rnd.choice(alphabet)
+                             for _ in xrange(rnd.randint(1, max_len))])
+    return corpus
+
+def all_ngrams(corpus, max_len=3):
+    toks = sorted(corpus._tokmap.values())
+    for n in xrange(1, max_len + 1):
+        for ngram in product(toks, repeat=n):
+            yield list(ngram)
+
+def random_removals(corpus, rnd):
+    ngrams = list(all_ngrams(corpus))
+    return dict((sen_i, [rnd.choice(ngrams) for _ in xrange(rnd.randint(1, 3))])
+                for sen_i in rnd.sample(xrange(len(corpus)), len(corpus) / 5))
+
+class PositionalTest(unittest.TestCase):
+    def check_positions(self, corpus):
+        for ngram in all_ngrams(corpus):
+            expected = {}
+            for sen_i, sen in enumerate(corpus):
+                positions = sen.ngram_positions(ngram)
+                if positions:
+                    expected[sen_i] = positions
+            self.assertEqual(dict(corpus.ngram_offsets(ngram)), expected)
+            self.assertEqual(set(corpus.ngram_index(ngram)), set(expected))
+
+    def check_layout(self, **kwargs):
+        rnd = random.Random(0)
+        corpus = random_corpus(positional=True, **kwargs)
+        self.check_positions(corpus)
+        # positions are rewritten by _update_positions() after removals
+        for backup in [False, True, False]:
+            corpus.remove_ngrams(random_removals(corpus, rnd), backup)
+            self.check_positions(corpus)
+
+    def test_positional(self):
+        self.check_layout()
+
+    def test_positional_compact(self):
+        self.check_layout(compact_index=True)
+
+    def test_positional_flat(self):
+        self.check_layout(flat=True, backup=True)
+
+def corpus_ngrams(corpus):
+    """ ngrams of two and three tokens in the corpus, and pairs of tokens,
+    that get adjacent if the token between them is removed """
+    result = set()
+    for sen in corpus:
+        toks = list(sen)
+        for i in xrange(len(toks) - 1):
+            result.update([tuple(toks[i:i + 2]), tuple(toks[i:i + 3]),
+                           tuple(toks[i:i + 3:2])])
+    return sorted(ngram for ngram in result if len(ngram) > 1)
+
+class NgramCacheTest(unittest.TestCase):
+    def check_same_as_uncached(self, cache_size, **kwargs):
+        rnd = random.Random(0)
+        # a sentence has a few of many tokens, so removals from one do not
+        # invalidate every cached ngram
+        kwargs.update(alphabet="abcdefghijklmnopqrst", max_len=6)
+        cached = random_corpus(ngram_cache_size=cache_size, **kwargs)
+        uncached = random_corpus(**kwargs)
+        ngrams = corpus_ngrams(uncached)
+        for _ in xrange(20):
+            for ngram in ngrams:
+                self.assertEqual(set(cached.ngram_index(ngram)),
+                                 set(uncached.ngram_index(ngram)))
+            # removing a single token makes its neighbours newly adjacent
+            sen_i = rnd.randrange(len(uncached))
+            toks = list(uncached[sen_i])
+            if len(toks) == 0:
+                continue
+            start = rnd.randrange(len(toks))
+            removals = {sen_i: [toks[start:start + rnd.choice([1, 1, 2])]]}
+            for corpus in [cached, uncached]:
+                corpus.remove_ngrams(removals)
+        return cached, ngrams
+
+    def test_same_as_uncached(self):
+        cached, ngrams = self.check_same_as_uncached(100000)
+        # ngrams survive removals in other sentences
+        self.assertTrue(cached._ngram_cache.hits > len(ngrams))
+
+    def test_evictions(self):
+        cached, ngrams = self.check_same_as_uncached(200, compact_index=True)
+        self.assertTrue(len(cached._ngram_cache) < len(ngrams))
+
+    def test_flat(self):
+        cached, ngrams = self.check_same_as_uncached(100000, flat=True)
+        self.assertTrue(cached._ngram_cache.hits > len(ngrams))
+
+    def test_newly_adjacent(self):
+        corpus = Corpus(False, int_tokens=True, ngram_cache_size=100)
+        corpus.add_sentence(["a", "x", "b"])
+        corpus.add_sentence(["a", "b"])
+        self.assertEqual(set(corpus.ngram_index(["a", "b"])), set([1]))
+        corpus.remove_ngram(["x"])
+        self.assertEqual(set(corpus.ngram_index(["a", "b"])), set([0, 1]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import random
+import unittest
+
+from flatcorpus import FlatSentences
+from sentence import Sentence
+from test_corpus import random_corpus
+
+def random_edit(sen, rnd, backup):
+    """ removes random tokens or ngrams from a Sentence or SentenceView """
+    toks = sen.get_tokens()
+    if len(toks) == 0:
+        return
+    if rnd.random() < 0.5:
+        n = min(len(toks), rnd.randint(1, 2))
+        sen.remove_toks(set(rnd.sample(toks, n)), backup)
+    else:
+        start = rnd.randrange(len(toks))
+        sen.remove_ngram(toks[start:start + rnd.randint(1, 2)], backup)
+
+class FlatSentencesTest(unittest.TestCase):
+    def test_set_keeps_slots(self):
+        store = FlatSentences()
+        for tokens in [[1, 2, 3], [4, 5, 6, 7], [8, 9]]:
+            store.append(tokens)
+        store.set(0, [1])
+        self.assertEqual(list(store.get(0)), [1])
+        self.assertEqual(list(store.get(1)), [4, 5, 6, 7])
+        # the slot keeps its original length
+        store.set(0, [3, 2, 1])
+        self.assertEqual(list(store.get(0)), [3, 2, 1])
+        self.assertRaises(ValueError, store.set, 0, [1, 2, 3, 4])
+        self.assertEqual(list(store.get(1)), [4, 5, 6, 7])
+
+    def test_set_shrinks_last_slot(self):
+        store = FlatSentences()
+        store.append([1, 2])
+        store.append([3, 4, 5])
+        store.set(1, [5])
+        self.assertEqual(len(store._tokens), 3)
+        self.assertRaises(ValueError, store.set, 1, [4, 5])
+        store.set(1, [])
+        store.append([6, 7])
+        self.assertEqual([list(sen) for sen in store], [[1, 2], [], [6, 7]])
+        self.assertEqual([len(sen) for sen in store], [2, 0, 2])
+
+    def check_same_as_sentences(self, backup):
+        # removals of a corpus are all backed up or none of them
+        rnd = random.Random(0)
+        store = FlatSentences(backup)
+        sentences = []
+        for _ in xrange(200):
+            tokens = [rnd.randint(0, 5) for _ in xrange(rnd.randint(0, 8))]
+            if not backup or rnd.random() < 0.5:
+                view = store.append(tokens)
+                sen = Sentence(tokens)
+            else:
+                # already filtered, like sentences read in parallel
+                removed = bytearray(rnd.random() < 0.3 for _ in tokens)
+                live = [tok for tok, r in zip(tokens, removed) if not r]
+                view = store.append(live, tokens, removed)
+                sen = Sentence(live)
+                sen.set_backup(tokens, removed)
+            for _ in xrange(rnd.randint(0, 3)):
+                state = rnd.getstate()
+                random_edit(view, rnd, backup)
+                rnd.setstate(state)
+                random_edit(sen, rnd, backup)
+            sentences.append(sen)
+
+        for view, sen in zip(store, sentences):
+            self.assertEqual(view.get_tokens(), sen.get_tokens())
+            self.assertEqual(view.get_tokens(backup=True),
+                             sen.get_tokens(backup=True))
+            orig, removed = view.get_backup()
+            sen_orig, sen_removed = sen.get_backup()
+            self.assertEqual(list(orig), list(sen_orig))
+            self.assertEqual(removed, sen_removed)
+
+    def test_same_as_sentences(self):
+        self.check_same_as_sentences(False)
+
+    def test_backup_same_as_sentences(self):
+        self.check_same_as_sentences(True)
+
+class FlatTokensTest(unittest.TestCase):
+    def test_same_as_sentences(self):
+        try:
+            from cooccurrence import _flat_tokens
+        except ImportError:
+            self.skipTest("cooccurrence needs numpy and scipy")
+        rnd = random.Random(0)
+        corpora = [random_corpus(flat=flat, backup=True) for flat in
+                   [False, True]]
+        removals = dict((sen_i, [[rnd.randint(0, 3)]])
+                        for sen_i in rnd.sample(xrange(300), 100))
+        for corpus in corpora:
+            corpus.remove_ngrams(removals, backup=True)
+        sentences, flat = corpora
+        for n in [0, 1, 150, 300]:
+            tokens, lens = _flat_tokens(flat._corpus, n)
+            tokens = tokens.tolist()
+            starts = [sum(lens[:sen_i]) for sen_i in xrange(n)]
+            self.assertEqual([tokens[start:start + l]
+                              for start, l in zip(starts, lens.tolist())],
+                             [list(sen) for sen in sentences[:n]])
+            self.assertEqual(len(tokens), sum(lens))
+
+if __name__ == "__main__":
+    unittest.main()
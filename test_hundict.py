@@ -0,0 +1,204 @@
+from array import array
+from collections import OrderedDict
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from bicorpus import BiCorpus
+from hundict import DictBuilder
+
+def word(rnd, side):
+    return "".join(rnd.choice("abcdefghijklmnoprstuv")
+                   for _ in xrange(rnd.randint(3, 8))) + side
+
+def write_corpus(path, n=2000, vocab_size=400, seed=0):
+    """
+    random parallel corpus with zipfian word frequencies: most words have
+    a translation, some are the same in both languages (for the strdiff
+    phase) and some are translated to two words (for ngrams)
+    """
+    rnd = random.Random(seed)
+    src_words = [word(rnd, "") for _ in xrange(vocab_size)]
+    translations = []
+    for i, src_word in enumerate(src_words):
+        if i % 7 == 0:
+            translations.append([src_word])
+        elif i % 5 == 0:
+            translations.append([word(rnd, "q"), word(rnd, "q")])
+        else:
+            translations.append([word(rnd, "q")])
+    f = open(path, "w")
+    for _ in xrange(n):
+        ids = [min(int(rnd.paretovariate(0.8)), vocab_size) - 1
+               for _ in xrange(rnd.randint(3, 10))]
+        src = [src_words[i] for i in ids]
+        tgt = []
+        for i in ids:
+            if rnd.random() < 0.1:
+                continue
+            tgt.extend(translations[i])
+        if rnd.random() < 0.3:
+            tgt.append("the")
+        if len(tgt) == 0:
+            tgt = ["the"]
+        rnd.shuffle(tgt)
+        f.write("{0}\t{1}\n".format(" ".join(src), " ".join(tgt)))
+    f.close()
+
+def read_bicorpus(path, **kwargs):
+    bc = BiCorpus(int_tokens=True, **kwargs)
+    bc.set_stopwords(set(), set(["the"]))
+    bc.read_from_file(open(path))
+    bc.build_cache()
+    return bc
+
+def new_builder(bc):
+    # wmi, strdiff, ngrams and sets
+    return DictBuilder(bc, DictBuilder.wmi, 5, True, True, True, 1, 2, 3)
+
+def dictionary(db):
+    return dict((pair, db._dict[pair]) for pair in db._dict)
+
+class MutualPairsTest(unittest.TestCase):
+    def random_pairs(self, rnd):
+        # scores with exact and near ties
+        scores = [0.25, 0.5, 0.5 - 3e-8, 1.0, 1.0 + 5e-8]
+        return dict((((rnd.randint(0, 6),), (rnd.randint(0, 6),)),
+                     rnd.choice(scores + [rnd.random()]))
+                    for _ in xrange(rnd.randint(0, 30)))
+
+    def test_batch_and_order(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("batch mode needs numpy")
+        rnd = random.Random(0)
+        filter_batch = DictBuilder.filter_mutual_pairs_batch
+        for _ in xrange(1000):
+            pairs = self.random_pairs(rnd)
+            mutual = dict(new_builder(None).filter_mutual_pairs(pairs))
+            reordered = OrderedDict(sorted(pairs.iteritems(), reverse=True))
+            self.assertEqual(
+                dict(new_builder(None).filter_mutual_pairs(reordered)), mutual)
+            items = pairs.items()
+            keep = filter_batch([pair[0][0] for pair, _ in items],
+                                [pair[1][0] for pair, _ in items],
+                                [score for _, score in items])
+            self.assertEqual(dict(item for item, k in zip(items, keep) if k),
+                             mutual)
+
+class BuildTest(unittest.TestCase):
+    bound = 0.0001
+    iters = 3
+    corpus_args = {}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmp, "corpus.txt")
+        write_corpus(self.corpus, **self.corpus_args)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def build(self, bc):
+        db = new_builder(bc)
+        db.build(self.bound, self.iters)
+        return db
+
+class SnapshotTest(BuildTest):
+    def test_same_as_fresh_build(self):
+        snapshot = os.path.join(self.tmp, "corpus.snapshot")
+        bc = read_bicorpus(self.corpus)
+        bc.save(snapshot)
+        fresh = self.build(bc)
+        loaded = self.build(BiCorpus.load(snapshot))
+        self.assertTrue(len(fresh._dict) > 0)
+        self.assertEqual(dictionary(loaded), dictionary(fresh))
+
+    def test_flat_views(self):
+        # flat sentences of a loaded snapshot are views of the file
+        snapshot = os.path.join(self.tmp, "corpus.snapshot")
+        bc = read_bicorpus(self.corpus, flat=True, backup=True)
+        bc.save(snapshot)
+        saved = open(snapshot, "rb").read()
+        fresh = self.build(bc)
+        loaded_bc = BiCorpus.load(snapshot, flat=True, backup=True)
+        self.assertFalse(isinstance(loaded_bc._src._corpus._tokens, array))
+        loaded = self.build(loaded_bc)
+        self.assertEqual(dictionary(loaded), dictionary(fresh))
+        backup_tokens = lambda bc: [sen.get_tokens(backup=True)
+                                    for sen in bc._src]
+        self.assertEqual(backup_tokens(loaded_bc), backup_tokens(bc))
+        # removals do not reach the file
+        self.assertEqual(open(snapshot, "rb").read(), saved)
+
+        # saving over the mapped file and appending keep the sentences
+        loaded_bc.save(snapshot)
+        loaded_bc.add_sentence_pair((["x", "y"], ["z"]))
+        self.assertEqual(backup_tokens(loaded_bc)[:-1], backup_tokens(bc))
+        self.assertEqual(loaded_bc._src[-1].get_tokens(),
+                         [loaded_bc._src._tokmap[tok] for tok in "xy"])
+
+class IncrementalTest(BuildTest):
+    def test_same_as_default(self):
+        default = self.build(read_bicorpus(self.corpus))
+        incremental = self.build(read_bicorpus(self.corpus, incremental=True))
+        self.assertTrue(len(default._dict) > 0)
+        self.assertEqual(dictionary(incremental), dictionary(default))
+
+class ResumeTest(BuildTest):
+    def corpus_state(self, db):
+        bc = db._bicorpus
+        return ([list(sen) for sen in bc._src], [list(sen) for sen in bc._tgt])
+
+    def test_same_as_uninterrupted_build(self):
+        full = self.build(read_bicorpus(self.corpus))
+        self.assertTrue(len(full._dict) > 0)
+        checkpoint = os.path.join(self.tmp, "checkpoint")
+        for stop in xrange(self.iters):
+            # interrupted after stop iterations
+            new_builder(read_bicorpus(self.corpus)).build(self.bound, stop,
+                                                          checkpoint)
+            resumed = new_builder(BiCorpus.load(checkpoint))
+            first_iter, bound = resumed.load_checkpoint(checkpoint)
+            self.assertEqual(first_iter, stop)
+            resumed.build(bound, self.iters, checkpoint, first_iter)
+            self.assertEqual(dictionary(resumed), dictionary(full))
+            self.assertEqual(self.corpus_state(resumed), self.corpus_state(full))
+
+class PairOrderTest(BuildTest):
+    # a corpus, where extensions of seeds overlap
+    corpus_args = dict(n=3000, vocab_size=150, seed=1)
+
+    def extend_and_remove(self, pairs):
+        bc = read_bicorpus(self.corpus)
+        db = DictBuilder(bc, DictBuilder.pmi, 5, False, True, False, 1, 2, 3)
+        extended = db.extend_with_ngrams(pairs)
+        db.remove_ngram_pairs(extended)
+        return extended, [list(sen) for sen in bc._src], [list(sen) for sen in bc._tgt]
+
+    def test_independent_of_pair_order(self):
+        bc = read_bicorpus(self.corpus)
+        db = DictBuilder(bc, DictBuilder.pmi, 5, False, True, False, 1, 2, 3)
+        pairs = sorted(db.build_unigram_pairs(self.bound).iteritems())
+        self.assertTrue(len(pairs) > 0)
+        forward = self.extend_and_remove(OrderedDict(pairs))
+        backward = self.extend_and_remove(OrderedDict(reversed(pairs)))
+        self.assertEqual(forward, backward)
+
+class BatchTest(BuildTest):
+    def test_same_as_scalar(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("batch mode needs numpy")
+        scalar = self.build(read_bicorpus(self.corpus))
+        db = new_builder(read_bicorpus(self.corpus))
+        db.batch = True
+        db.build(self.bound, self.iters)
+        self.assertEqual(dictionary(db), dictionary(scalar))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from lru import LRUCache
+
+class LRUCacheTest(unittest.TestCase):
+    def test_bounded_by_size(self):
+        cache = LRUCache(10)
+        self.assertEqual(cache.put("a", [1, 2, 3]), [])
+        self.assertEqual(cache.put("b", [1, 2, 3]), [])
+        # a is used more recently than b
+        self.assertEqual(cache.get("a"), [1, 2, 3])
+        self.assertEqual(cache.put("c", [1, 2]), ["b"])
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # larger than the whole cache
+        self.assertEqual(cache.put("d", range(10)), [])
+        self.assertEqual(cache.get("d"), None)
+        cache.discard("a")
+        self.assertEqual(cache.put("e", [1, 2, 3, 4, 5]), [])
+        self.assertEqual(len(cache), 2)
+
+if __name__ == "__main__":
+    unittest.main()
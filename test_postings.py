@@ -0,0 +1,41 @@
+import random
+import unittest
+
+from postings import PostingList, PositionList
+
+class PostingListTest(unittest.TestCase):
+    def random_indices(self, rnd):
+        n = rnd.choice([5, 50, 5000])
+        return rnd.sample(xrange(n), rnd.randint(0, n / 2))
+
+    def test_set_operations(self):
+        rnd = random.Random(0)
+        for _ in xrange(1000):
+            a, b = self.random_indices(rnd), self.random_indices(rnd)
+            pa, pb = PostingList(sorted(a)), PostingList(sorted(b))
+            self.assertEqual(list(pa | pb), sorted(set(a) | set(b)))
+            self.assertEqual(list(pa & pb), sorted(set(a) & set(b)))
+            self.assertEqual(list(pa - pb), sorted(set(a) - set(b)))
+            # mixed with sets
+            self.assertEqual(list(set(a) | pb), sorted(set(a) | set(b)))
+
+    def test_from_iterable(self):
+        rnd = random.Random(0)
+        for _ in xrange(100):
+            a, b = self.random_indices(rnd), self.random_indices(rnd)
+            self.assertEqual(list(PostingList.from_iterable(a + b)),
+                             sorted(set(a) | set(b)))
+            self.assertEqual(list(PostingList.from_iterable(set(a))), sorted(a))
+
+    def test_followed_by(self):
+        rnd = random.Random(0)
+        for _ in xrange(300):
+            a, b = self.random_indices(rnd), self.random_indices(rnd)
+            shift = rnd.randint(1, 3)
+            self.assertEqual(
+                list(PositionList(sorted(a)).followed_by(
+                    PositionList(sorted(b)), shift)),
+                sorted(x for x in a if x + shift in set(b)))
+
+if __name__ == "__main__":
+    unittest.main()
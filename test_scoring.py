@@ -0,0 +1,43 @@
+from itertools import product
+import random
+import unittest
+
+from hundict import DictBuilder
+
+SCORERS = ["pmi", "wmi", "dice", "llr", "chi2", "tscore"]
+
+def tables():
+    # every table of small counts, zero rows and columns included
+    result = list(product([0, 1, 3], repeat=4))
+    rnd = random.Random(0)
+    for _ in xrange(500):
+        result.append(tuple(rnd.randint(0, 1000) for _ in xrange(4)))
+    return result
+
+class ScoringTest(unittest.TestCase):
+    def test_same_as_scalar_scorers(self):
+        try:
+            import scoring
+        except ImportError:
+            self.skipTest("vectorized scorers need numpy")
+        all_tables = tables()
+        for name in SCORERS:
+            db = DictBuilder(None, getattr(DictBuilder, name), 5, False,
+                             False, False, 1, 2, 3)
+            scores = getattr(scoring, name)(all_tables)
+            for table, score in zip(all_tables, scores.tolist()):
+                self.assertAlmostEqual(score, db.score(table), places=9,
+                                       msg="{0} {1}".format(name, table))
+
+    def test_signed_association(self):
+        for name in ["llr", "chi2"]:
+            scorer = getattr(DictBuilder, name)
+            self.assertTrue(scorer((10, 2, 2, 100)) > 0)
+            self.assertTrue(scorer((1, 20, 20, 100)) < 0)
+            self.assertEqual(scorer((1, 20, 20, 400)), 0)
+            # swapping the two rows swaps the sign
+            self.assertAlmostEqual(scorer((10, 2, 2, 100)),
+                                   -scorer((2, 100, 10, 2)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import random
+import unittest
+
+from strdiff import bounded_levenshtein, DeletionIndex
+
+def levenshtein(a, b):
+    prev = range(len(b) + 1)
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1,
+                           prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+def random_word(rnd, max_len=8):
+    # few letters, so words are often close
+    return "".join(rnd.choice("abc") for _ in xrange(rnd.randint(0, max_len)))
+
+class BoundedLevenshteinTest(unittest.TestCase):
+    def test_same_as_levenshtein(self):
+        rnd = random.Random(0)
+        for _ in xrange(3000):
+            a, b = random_word(rnd), random_word(rnd)
+            dist = levenshtein(a, b)
+            for k in xrange(4):
+                self.assertEqual(bounded_levenshtein(a, b, k), min(dist, k + 1))
+
+class DeletionIndexTest(unittest.TestCase):
+    def test_recall(self):
+        rnd = random.Random(0)
+        words = list(set(random_word(rnd) for _ in xrange(300)))
+        index = DeletionIndex(2)
+        for item, word in enumerate(words):
+            index.add(word, item)
+        for _ in xrange(100):
+            query = random_word(rnd)
+            for max_dist in xrange(3):
+                expected = set((item, levenshtein(query, word))
+                               for item, word in enumerate(words)
+                               if levenshtein(query, word) <= max_dist)
+                self.assertEqual(set(index.search(query, max_dist)), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+from heapq import heappush, heappop
+from math import ceil
+
+class SpaceSaving(object):
+    """
+    space-saving heavy hitters counter (Metwally et al.)
+    it keeps at most capacity counters. When a new item comes and there is
+    no free counter, the item with the smallest count is replaced, and the
+    new item inherits its count. Every count is overestimated by at most
+    total / capacity, where total is the sum of added weights, and every
+    item with a real count above that is kept
+    """
+    __slots__ = ["_capacity", "_counts", "_heap"]
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._counts = {}
+        # min heap of (count, item), entries can be stale after increments,
+        # they are fixed lazily when an eviction finds them
+        self._heap = []
+
+    @classmethod
+    def with_error(cls, max_per_word, error):
+        return cls(max(max_per_word, int(ceil(1.0 / error))))
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, item, weight=1):
+        counts = self._counts
+        if item in counts:
+            counts[item] += weight
+            return
+        if len(counts) < self._capacity:
+            counts[item] = weight
+            heappush(self._heap, (weight, item))
+            return
+
+        heap = self._heap
+        while True:
+            count, old = heappop(heap)
+            if counts[old] == count:
+                break
+            heappush(heap, (counts[old], old))
+        del counts[old]
+        counts[item] = count + weight
+        heappush(heap, (count + weight, item))
+
+    def top(self, n):
+        """ best n items as a dict, ties are broken by item """
+        return dict(sorted(self._counts.iteritems(),
+                           key=lambda x: (-x[1], x[0]))[:n])